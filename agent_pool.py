@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Sequence
+
+class AgentPoolStats:
+    def __init__(self, max_samples: int = 1000):
+        self.builds = 0
+        self.reuses = 0
+        self.discards = 0
+        self.evicted_keys = 0
+        self.build_latencies = deque(maxlen=max_samples)
+
+    def record_build(self, seconds: float):
+        self.builds += 1
+        self.build_latencies.append(seconds)
+
+    @property
+    def median_build_seconds(self) -> float:
+        # the median: the first build of a process also pays one-off lazy imports
+        latencies = sorted(self.build_latencies)
+        return latencies[(len(latencies) - 1) // 2] if latencies else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "builds": self.builds,
+            "reuses": self.reuses,
+            "discards": self.discards,
+            "evicted_keys": self.evicted_keys,
+            "median_build_ms": round(self.median_build_seconds * 1000, 3),
+            # what the reused agents would have cost to build
+            "saved_ms": round(self.reuses * self.median_build_seconds * 1000, 3),
+        }
+
+class AgentPool:
+    """
+    Pool of idle agents keyed by (tools, LLM).
+
+    Building an agent generates every tool schema and assembles its prompts, so
+    agents are built once by `factory(tools, llm)` and leased out. A lease is
+    exclusive, so concurrent steps each get their own agent; the agent's memory is
+    reset when it comes back, and an agent whose run raised is dropped instead.
+    At most `max_idle` agents are kept per key, and for at most `max_keys` keys:
+    a caller passing a new LLM object each time adds a key per call, so the agents
+    of the least recently used key are dropped beyond that.
+    """
+
+    def __init__(self, factory: Callable, max_idle: int = 8, max_keys: int = 32):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.max_keys = max_keys
+        self.stats = AgentPoolStats()
+        self._lock = threading.Lock()
+        self._idle: "OrderedDict[tuple, list]" = OrderedDict()
+
+    @staticmethod
+    def _key(tools: Sequence, llm) -> tuple:
+        # identity is the cheap, exact key; the pooled agents keep their LLM alive, so its id is not reused
+        return tuple(id(tool) for tool in tools), id(llm)
+
+    def acquire(self, tools: Sequence, llm=None):
+        key = self._key(tools, llm)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self._idle.move_to_end(key)
+                self.stats.reuses += 1
+                return idle.pop()
+        start = time.perf_counter()
+        agent = self.factory(list(tools), llm)
+        with self._lock:
+            self.stats.record_build(time.perf_counter() - start)
+        return agent
+
+    def release(self, tools: Sequence, llm, agent):
+        agent.reset()
+        key = self._key(tools, llm)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            if len(idle) < self.max_idle:
+                idle.append(agent)
+            while len(self._idle) > self.max_keys:
+                self._idle.popitem(last=False)
+                self.stats.evicted_keys += 1
+
+    @contextmanager
+    def lease(self, tools: Sequence, llm=None):
+        agent = self.acquire(tools, llm)
+        try:
+            yield agent
+        except BaseException:
+            with self._lock:
+                self.stats.discards += 1
+            raise
+        self.release(tools, llm, agent)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
@@ -0,0 +1,132 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+# rows scored per step when assigning vectors to their nearest centroid
+assign_chunk_rows = 65536
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over a normalised matrix.
+
+    Vectors are clustered with spherical k-means into `nlist` lists. A query scores
+    the centroids, scans only the rows of the `nprobe` closest lists and ranks them
+    exactly, so recall/latency is traded off with nprobe (nprobe == nlist is exact).
+    The index only stores row numbers; vectors stay in the caller's matrix.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_rows: np.ndarray, nprobe: int = 8):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def num_rows(self) -> int:
+        return self.list_rows.shape[0]
+
+    @staticmethod
+    def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        assignments = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], assign_chunk_rows):
+            block = np.asarray(matrix[start:start + assign_chunk_rows], dtype=np.float32)
+            assignments[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        nlist: Optional[int] = None,
+        n_iter: int = 10,
+        max_training_rows: int = 64,
+        nprobe: int = 8,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """
+        Train centroids on a sample of at most max_training_rows * nlist rows and
+        assign every row of `matrix` to its closest centroid.
+        """
+        n = matrix.shape[0]
+        if nlist is None:
+            nlist = max(1, int(math.sqrt(n)))
+        nlist = max(1, min(nlist, n))
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n, nlist * max_training_rows)
+        sample_rows = np.sort(rng.choice(n, size=sample_size, replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # re-seed empty clusters with random sample rows
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        assignments = cls._assign(matrix, centroids)
+        list_rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_rows, nprobe=nprobe)
+
+    def search(
+        self,
+        matrix: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        excluded_rows: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the approximate top-k rows, best first."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        candidates = np.concatenate(
+            [self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes]
+        )
+        if excluded_rows is not None and len(excluded_rows):
+            candidates = candidates[~np.isin(candidates, excluded_rows)]
+        if not len(candidates):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # sorted row order keeps reads from a memory-mapped matrix sequential
+        candidates.sort()
+        scores = np.asarray(matrix[candidates], dtype=np.float32) @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                list_offsets=self.list_offsets,
+                list_rows=self.list_rows,
+                nprobe=np.int64(self.nprobe),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(
+                data["centroids"],
+                data["list_offsets"],
+                data["list_rows"],
+                nprobe=int(data["nprobe"]),
+            )
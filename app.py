@@ -1,15 +1,19 @@
 import asyncio
 from dotenv import load_dotenv
 import os
-from retriever import get_query_engine
+from retriever import aquery_interest_rates
 from llama_index.core.agent.workflow import AgentWorkflow
-from llama_index.llms.gemini import Gemini
 from datetime import datetime
 from llama_index.core.workflow import Context
 from llama_index.core.agent.workflow import FunctionAgent, ReActAgent
 from llama_index.core.agent.workflow import AgentWorkflow
-from customer_db import create_banking_customer_db
-from pending_tx_agent import get_pending_tx_details
+import customer_db  # registers the customer_db.* services used by the tools
+from pending_tx_agent import aget_pending_tx_details
+from async_tools import async_tool, acomplete
+from sessions import SessionManager
+from chat_memory import BoundedChatMemory, set_summary_llm
+from services import services
+from lazy_llm import LazyLLM
 import pandas as pd
 # import streamlit as st
 
@@ -19,36 +23,42 @@ load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-query_engine = get_query_engine()
-customer_db_query_engine = create_banking_customer_db()
+def create_llm():
+    from llama_index.llms.gemini import Gemini
+    return Gemini(model="models/gemini-2.0-flash",api_key=GOOGLE_API_KEY)
 
-llm = Gemini(model="models/gemini-2.0-flash",api_key=GOOGLE_API_KEY)
+# the Gemini client is built on the first call, the customer DB on the first customer question
+services.register("app.llm", create_llm, per_process=True)
+llm = LazyLLM("app.llm")
 
 #  tools
+@async_tool(timeout=60)
 async def search_interest_rates(ctx: Context, question: str) -> str:
     """Ask a question to the bank account interest rate documents stored in the vector index."""
     print("search interest rates tool called")
-    interest_rates = query_engine.query(question)
+    interest_rates = await aquery_interest_rates(question)
     current_state = await ctx.get("state")
     # Store the interest rates in the state
     current_state["interest_rates"] = str(interest_rates)
     await ctx.set("state", current_state)
     return f"Interest rates extracted for {question}: {interest_rates}"
 
+@async_tool(max_concurrency=8, timeout=60)
 async def search_customer_details(ctx: Context, question: str) -> str:
     """Ask a question to the bank customer database which contains customer and account information in a SQL database."""
     print("search customer details tool called")
-    customer_details = customer_db_query_engine.query(question)
+    customer_details = await services.get("customer_db.query_engine").aquery(question)
     current_state = await ctx.get("state")
     # Store the customer details in the state
     current_state["customer_details"] = str(customer_details)
     await ctx.set("state", current_state)
     return f"Customer details extracted for {question}: {customer_details}"
 
+@async_tool(max_concurrency=8, timeout=60)
 async def search_pending_tx_details_from_df(ctx: Context, question: str) -> str:
     """Get the total amount of pending transactions for a customer from a Pandas dataframe."""
     print("search pending tx details tool called")
-    response = get_pending_tx_details(question)
+    response = await aget_pending_tx_details(question)
     current_state = await ctx.get("state")
     # Store the pending transactions details in the state
     current_state["pending_tx_details"] = str(response)
@@ -56,6 +66,7 @@ async def search_pending_tx_details_from_df(ctx: Context, question: str) -> str:
     return f"Pending transactions details extracted for {question}: {response}"
 
 # TODO: Add the overall analysis tool
+@async_tool(timeout=120)
 async def overall_analysis(ctx: Context) -> str:
     """Get the overall analysis of the bank account for a customer from a Pandas dataframe."""
     print("overall analysis tool called")
@@ -90,7 +101,7 @@ async def overall_analysis(ctx: Context) -> str:
     If any of the above information is not available, please mention that in your analysis.
     """
     
-    overall_analysis = llm.complete(prompt)
+    overall_analysis = await acomplete(llm, prompt)
 
     print("overall analysis : ", overall_analysis)
     
@@ -157,26 +168,30 @@ agent_workflow = AgentWorkflow(
     },
 )
 
-ctx = Context(agent_workflow)
+# one context per customer session, so conversations never share chat history or state;
+# each keeps recent turns plus a summary of older ones, so prompts stay flat as sessions grow
+set_summary_llm(llm)
+sessions = SessionManager(agent_workflow, memory_factory=BoundedChatMemory.from_defaults)
 
 async def main():
     question_1 = "Whats the Cash ISA Saver's annual interest rate for an account opened after 18/02/25? Todays date is " + today
     question_2 = "List all the details of Bob Brown?"
     question_3 = "What is the total amount of pending transactions for Bob Brown and round off to 2 decimal places?"
 
-    response_1 = await agent_workflow.run(user_msg=question_1, ctx=ctx)
-    response_2 = await agent_workflow.run(user_msg=question_2, ctx=ctx)
-    response_3 = await agent_workflow.run(user_msg=question_3, ctx=ctx)
+    response_1 = await sessions.run("demo", question_1)
+    response_2 = await sessions.run("demo", question_2)
+    response_3 = await sessions.run("demo", question_3)
     
     print(response_1)
     print(response_2)
     print(response_3)
+    print(sessions.summary())
 
 if __name__ == "__main__":
     asyncio.run(main())
 
-# async def get_answer(query: str):
-#     response = await agent_workflow.run(user_msg=query, ctx=ctx)
+# async def get_answer(session_id: str, query: str):
+#     response = await sessions.run(session_id, query)
 #     return response
 
 # st.title("Personal Banking Assistant")
@@ -0,0 +1,107 @@
+import asyncio
+import functools
+import inspect
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# threads for sync work (engines without a real async path) offloaded from the event loop
+tool_executor_workers = 16
+
+# per-tool defaults: calls in flight at once and seconds before a call is abandoned
+default_tool_concurrency = 32
+default_tool_timeout = 120.0
+
+tool_executor = ThreadPoolExecutor(max_workers=tool_executor_workers, thread_name_prefix="tool")
+
+async def run_sync(fn: Callable, *args, **kwargs):
+    """Run a blocking callable on the shared tool executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(tool_executor, functools.partial(fn, *args, **kwargs))
+
+async def aquery(query_engine, query: str):
+    """Query an engine without blocking the loop: aquery if it has one, else the executor."""
+    if hasattr(query_engine, "aquery"):
+        return await query_engine.aquery(query)
+    return await run_sync(query_engine.query, query)
+
+async def acomplete(llm, prompt: str):
+    """Complete a prompt without blocking the loop: acomplete if the LLM has one, else the executor."""
+    if hasattr(llm, "acomplete"):
+        return await llm.acomplete(prompt)
+    return await run_sync(llm.complete, prompt)
+
+class ToolStats:
+    def __init__(self):
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_seconds = 0.0
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "mean_ms": round(self.total_seconds / self.calls * 1000, 2) if self.calls else 0.0,
+        }
+
+tool_stats: Dict[str, ToolStats] = {}
+
+def async_tool(
+    name: Optional[str] = None,
+    max_concurrency: int = default_tool_concurrency,
+    timeout: Optional[float] = default_tool_timeout,
+):
+    """
+    Decorates a tool function so it never blocks the event loop and can't pile up.
+
+    Sync functions run on the tool executor. At most `max_concurrency` calls of the
+    tool run at once (others wait their turn) and a call taking longer than
+    `timeout` seconds is abandoned with a message the agent can act on. The
+    signature and docstring are kept, so FunctionTool builds the same schema.
+    """
+
+    def decorator(fn: Callable):
+        tool_name = name or fn.__name__
+        stats = tool_stats.setdefault(tool_name, ToolStats())
+        # semaphores belong to one event loop: keep one per loop
+        semaphores = weakref.WeakKeyDictionary()
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            semaphore = semaphores.get(loop)
+            if semaphore is None:
+                semaphore = semaphores[loop] = asyncio.Semaphore(max_concurrency)
+
+            async with semaphore:
+                stats.calls += 1
+                stats.in_flight += 1
+                stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+                start = time.perf_counter()
+                try:
+                    if inspect.iscoroutinefunction(fn):
+                        call = fn(*args, **kwargs)
+                    else:
+                        call = run_sync(fn, *args, **kwargs)
+                    return await asyncio.wait_for(call, timeout)
+                except asyncio.TimeoutError:
+                    stats.timeouts += 1
+                    print(f"{tool_name} timed out after {timeout}s")
+                    return f"The {tool_name} tool timed out after {timeout} seconds, please try again later."
+                except Exception:
+                    stats.errors += 1
+                    raise
+                finally:
+                    stats.in_flight -= 1
+                    stats.total_seconds += time.perf_counter() - start
+
+        return wrapper
+
+    return decorator
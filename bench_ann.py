@@ -0,0 +1,90 @@
+"""
+Benchmark the IVF index against exact search on synthetic clustered vectors.
+
+Reports recall@k versus exact search and p50/p99 query latency for a range of
+nprobe values, e.g.
+
+    python bench_ann.py --sizes 10000 100000 1000000 --dim 64
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex
+
+def synthetic_vectors(n: int, centres: np.ndarray, rng) -> np.ndarray:
+    """Normalised vectors drawn around cluster centres, like topical document chunks."""
+    clusters, dim = centres.shape
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100000):
+        size = min(100000, n - start)
+        labels = rng.integers(0, clusters, size=size)
+        block = centres[labels] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+        vectors[start:start + size] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+def exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = matrix @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def latency_summary(latencies) -> dict:
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+def run(n: int, dim: int, num_queries: int, k: int, nprobes, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(10, n // 1000), dim)).astype(np.float32)
+    matrix = synthetic_vectors(n, centres, rng)
+    queries = synthetic_vectors(num_queries, centres, rng)
+
+    exact_results = []
+    exact_latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        exact_results.append(exact_top_k(matrix, query, k))
+        exact_latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(matrix)
+    build_seconds = time.perf_counter() - start
+
+    result = {
+        "n": n,
+        "dim": dim,
+        "nlist": ivf.nlist,
+        "build_seconds": round(build_seconds, 2),
+        "exact": latency_summary(exact_latencies),
+        "ivf": [],
+    }
+    for nprobe in nprobes:
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, exact_results):
+            start = time.perf_counter()
+            rows, _ = ivf.search(matrix, query, k, nprobe=nprobe)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(rows.tolist()) & set(expected.tolist()))
+        result["ivf"].append({
+            "nprobe": nprobe,
+            f"recall@{k}": round(hits / (k * len(queries)), 4),
+            **latency_summary(latencies),
+        })
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        print(json.dumps(run(n, args.dim, args.queries, args.k, args.nprobes), indent=2))
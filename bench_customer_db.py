@@ -0,0 +1,146 @@
+"""
+Load test the async customer query path at increasing concurrency.
+
+A temporary customer database is filled with synthetic customers and queried
+through SQLTemplateCache.aquery. The text-to-SQL engine is replaced by one that
+sleeps for --llm-latency seconds (SQL generation plus synthesis) before running
+its SQL, so no API key is needed. Reports throughput and p50/p99 latency per
+concurrency level for cache misses and cache hits, e.g.
+
+    python bench_customer_db.py --customers 100000 --concurrency 1 4 16 --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from llama_index.core import SQLDatabase
+from llama_index.core.base.response.schema import Response
+
+import customer_db
+from sql_cache import SQLTemplateCache, mask_entities
+
+class SleepingSQLEngine:
+    """Stands in for NLSQLTableQueryEngine: fixed 'LLM' latency, then a real indexed query."""
+
+    def __init__(self, sql_database: SQLDatabase, latency: float):
+        self.sql_database = sql_database
+        self.latency = latency
+
+    def query(self, question: str):
+        _, values = mask_entities(question)
+        time.sleep(self.latency)
+        sql = f"SELECT customer_name, account_balance FROM customer WHERE customer_name = '{values[0]}'"
+        response_str, metadata = self.sql_database.run_sql(sql)
+        return Response(response=response_str, metadata={**metadata, "sql_query": sql})
+
+def synthetic_name(i: int) -> str:
+    """
+    Letters-only name per customer that mask_entities() takes whole, like a real one: at least
+    two letters per word, and no question stopword ("Customer", "Is") in front.
+    """
+    letters = ""
+    # offset by 26 so even the first customers get two letters
+    i += 26
+    while i:
+        i, remainder = divmod(i, 26)
+        letters += "abcdefghijklmnopqrstuvwxyz"[remainder]
+    return "Synthetic " + letters.capitalize()
+
+def synthetic_customers(n: int):
+    for i in range(n):
+        yield {
+            "customer_id": f"X{i:07d}",
+            "customer_name": synthetic_name(i),
+            "customer_address": f"{i} High St, London, UK",
+            "customer_email": f"customer{i}@example.com",
+            "customer_dob": "1990-01-01",
+            "customer_income": "£40000",
+            "account_balance": f"£{i % 100000}",
+        }
+
+def latency_summary(latencies) -> dict:
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+async def run_level(cache: SQLTemplateCache, questions, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(question):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await cache.aquery(question)
+            latencies.append(time.perf_counter() - start)
+        # every question names one customer: a miss or a bad template shows up as another count
+        rows = response.metadata.get("result", [])
+        assert len(rows) == 1, f"{question!r} matched {len(rows)} customers"
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(question) for question in questions])
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "queries": len(questions),
+        "qps": round(len(questions) / elapsed, 1),
+        **latency_summary(latencies),
+    }
+
+def run(num_customers: int, num_queries: int, concurrency_levels, llm_latency: float, workers: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = customer_db.create_customer_engine(os.path.join(tmp, "customer.db"))
+        start = time.perf_counter()
+        customer_db.load_customers(engine, synthetic_customers(num_customers), money_units="major")
+        load_seconds = time.perf_counter() - start
+
+        sql_database = SQLDatabase(engine, include_tables=["customer"])
+        rng = np.random.default_rng(0)
+        questions = [
+            f"What is {synthetic_name(int(i))}'s balance?"
+            for i in rng.integers(0, num_customers, size=num_queries)
+        ]
+        result = {
+            "customers": num_customers,
+            "load_seconds": round(load_seconds, 2),
+            "llm_latency": llm_latency,
+            "workers": workers,
+            "miss": [],
+            "hit": [],
+        }
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for mode in ("miss", "hit"):
+                for concurrency in concurrency_levels:
+                    cache = SQLTemplateCache(
+                        SleepingSQLEngine(sql_database, llm_latency),
+                        sql_database,
+                        synthesize=False,
+                        executor=executor,
+                    )
+                    if mode == "hit":
+                        cache.query(questions[0])
+                    else:
+                        cache.max_templates = 0
+                    result[mode].append(asyncio.run(run_level(cache, questions, concurrency)))
+        engine.dispose()
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=customer_db.customer_db_max_concurrency)
+    args = parser.parse_args()
+
+    print(json.dumps(
+        run(args.customers, args.queries, args.concurrency, args.llm_latency, args.workers),
+        indent=2,
+    ))
@@ -0,0 +1,236 @@
+"""
+End-to-end benchmark of the workflows with a scripted local LLM, no API calls.
+
+Each workflow is driven with the questions of app.py's main at each
+concurrency level, every client sending its next question as soon as it has
+an answer:
+
+    app            the AgentWorkflow of app.py, one chat session per client
+    wf_agents      CustomerInvestmentAdvisorAgent
+    sub_questions  SubQuestionQueryEngine with the banking tools
+
+fake_llm.ScriptedLLM answers after --llm-latency seconds, streams at
+--tokens-per-second and calls the tools each question is about, so the tools
+really run: the vector index (built here from canned interest rate text with
+the deterministic HashEmbedding), a temporary customer DB and the pending
+transactions of docs/pending_tx.csv. The LLM rate limit of wf_agents is set to
+--llm-requests-per-second.
+
+Reports p50/p95/p99 latency, requests per second, LLM calls and embedding
+calls per request and the peak RSS of the process so far, per workflow and
+level. --output saves the report as JSON; --baseline compares with a saved
+report, e.g. of the previous commit:
+
+    python bench_e2e.py --concurrency 1 8 32 --requests 64 --output bench_e2e.json
+    python bench_e2e.py --concurrency 1 8 32 --requests 64 --baseline bench_e2e.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+from embedding_cache import HashEmbedding
+from fake_llm import ScriptedLLM, use_fake_llm
+from services import services
+
+workflows = ["app", "wf_agents", "sub_questions"]
+
+questions = [
+    "Whats the Cash ISA Saver's annual interest rate for an account opened after 18/02/25?",
+    "List all the details of Bob Brown?",
+    "What is the total amount of pending transactions for Bob Brown and round off to 2 decimal places?",
+]
+
+# synthetic stand-ins for the interest rate documents
+interest_rate_texts = [
+    "Cash ISA Saver: accounts opened on or after 18/02/25 earn 4.10% AER (4.03% gross) variable on all balances.",
+    "Cash ISA Saver: accounts opened before 18/02/25 earn 3.85% AER (3.78% gross) variable on all balances.",
+    "Fixed Rate ISA: 1 year fixed at 4.25% AER, 2 year fixed at 4.05% AER; withdrawals are subject to a charge.",
+    "Easy Access Saver: 3.50% AER variable on balances from £1, interest paid monthly or annually.",
+    "Regular Saver: 6.00% AER fixed for 12 months on monthly deposits of £25 to £250.",
+]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+def set_up(workdir: str, llm_latency: float, tokens_per_second: float, embed_latency: float, llm_requests_per_second: float):
+    """Serve every LLM, the embedding model, the index and the data from local fakes and files under workdir."""
+    from llama_index.core import Document, StorageContext, VectorStoreIndex
+
+    import customer_db
+    import pending_tx_agent
+    import retriever
+    from numpy_vector_store import NumpyVectorStore
+    from wf_agents import llm_rate_limiter
+
+    llm = use_fake_llm(llm=ScriptedLLM(latency=llm_latency, tokens_per_second=tokens_per_second))
+    llm_rate_limiter.configure(rate=llm_requests_per_second, capacity=max(1, int(llm_requests_per_second)))
+
+    embed_model = HashEmbedding(embed_dim=64, latency=embed_latency)
+    services.set("retriever.embed_model", embed_model)
+
+    index_dir = os.path.join(workdir, "vector_index")
+    index = VectorStoreIndex.from_documents(
+        [Document(text=text) for text in interest_rate_texts],
+        storage_context=StorageContext.from_defaults(vector_store=NumpyVectorStore()),
+        embed_model=embed_model,
+    )
+    index.storage_context.persist(persist_dir=index_dir)
+    retriever.index_registry = retriever.IndexRegistry(index_dir)
+
+    services.set(
+        "customer_db.query_engine",
+        customer_db.create_banking_customer_db(db_path=os.path.join(workdir, "customer.db")),
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    services.set(
+        "pending_tx_agent.pending_tx_store",
+        pending_tx_agent.PendingTxStore.load(os.path.join(here, pending_tx_agent.pending_tx_path), cache_dir=None),
+    )
+    return llm, embed_model
+
+def make_runner(workflow: str, workdir: str, llm):
+    """An async function answering question i for a client."""
+    if workflow == "app":
+        import app
+
+        app.sessions.directory = os.path.join(workdir, "sessions")
+
+        async def run(client: int, question: str):
+            return await app.sessions.run(f"bench-{client}", question)
+
+    elif workflow == "wf_agents":
+        from wf_agents import request_gate
+        from wf_agents_app import start_advisor
+
+        async def run(client: int, question: str):
+            async with request_gate.admit():
+                return await start_advisor(question, verbose=False, timeout=None)
+
+    else:
+        from sub_question_query_engine import SubQuestionQueryEngine
+        from wf_agents_app import advisor_tools
+
+        async def run(client: int, question: str):
+            engine = SubQuestionQueryEngine(timeout=None)
+            return await engine.run(llm=llm, tools=advisor_tools, query=question)
+
+    return run
+
+async def load(run, concurrency: int, requests: int) -> dict:
+    latencies = []
+    errors = Counter()
+    counter = iter(range(requests))
+
+    async def client(index: int):
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await run(index, questions[i % len(questions)])
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            else:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    report = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": dict(errors),
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+    }
+    if latencies:
+        report.update({f"p{p}_ms": round(float(np.percentile(latencies, p)), 1) for p in (50, 95, 99)})
+    return report
+
+async def bench(workflow: str, workdir: str, llm, embed_model, levels: list, requests: int) -> list:
+    run = make_runner(workflow, workdir, llm)
+    results = []
+    for concurrency in levels:
+        llm_calls, embed_calls = llm.calls, embed_model.calls
+        report = await load(run, concurrency, requests)
+        report["llm_calls_per_request"] = round((llm.calls - llm_calls) / requests, 2)
+        report["embedding_calls_per_request"] = round((embed_model.calls - embed_calls) / requests, 2)
+        report["peak_rss_mb"] = peak_rss_mb()
+        results.append(report)
+    return results
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Ratios to the baseline per workflow and concurrency: above 1 is slower (latency) or faster (throughput)."""
+    comparison = {}
+    for workflow, results in report["results"].items():
+        previous = {r["concurrency"]: r for r in baseline.get("results", {}).get(workflow, [])}
+        for result in results:
+            before = previous.get(result["concurrency"])
+            if not before:
+                continue
+            comparison.setdefault(workflow, {})[result["concurrency"]] = {
+                key: round(result[key] / before[key], 2)
+                for key in ("p50_ms", "p95_ms", "p99_ms", "requests_per_second", "llm_calls_per_request", "peak_rss_mb")
+                if result.get(key) and before.get(key)
+            }
+    return comparison
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workflows", nargs="+", choices=workflows, default=workflows)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=48, help="requests per workflow and concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds to the first token of each LLM call")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="speed of streamed answers")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedding call")
+    parser.add_argument("--llm-requests-per-second", type=float, default=1000, help="LLM rate limit of wf_agents")
+    parser.add_argument("--output", default=None, help="save the report as JSON")
+    parser.add_argument("--baseline", default=None, help="a saved report to compare with")
+    parser.add_argument("--verbose", action="store_true", help="keep the workflows' output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        llm, embed_model = set_up(
+            workdir, args.llm_latency, args.tokens_per_second, args.embed_latency, args.llm_requests_per_second
+        )
+        results = {}
+        for workflow in args.workflows:
+            print(f"benchmarking {workflow}", file=sys.stderr)
+            with contextlib.ExitStack() as stack:
+                if not args.verbose:
+                    stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+                results[workflow] = asyncio.run(
+                    bench(workflow, workdir, llm, embed_model, args.concurrency, args.requests)
+                )
+
+    report = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "verbose")},
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(report, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
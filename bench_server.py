@@ -0,0 +1,149 @@
+"""
+Load-test the HTTP service of server.py.
+
+--concurrency clients send --requests requests in total, each client sending
+its next request as soon as it has an answer. Chat clients have a session of
+their own. For each concurrency level the status codes, latency percentiles
+and throughput are reported (and for /advisor/stream, the time to the first
+event and to the first token of the answer), followed by the server's /stats.
+
+By default the app is served on a local port by this process with
+fake_llm.FakeLLM, so no API is called; --url targets a running server
+instead, e.g. one started with `python server.py --fake-llm`:
+
+    python bench_server.py --endpoint chat --concurrency 1 8 32 --requests 200 --llm-latency 0.2
+    python bench_server.py --url http://127.0.0.1:8000 --endpoint advisor/stream --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import socket
+import time
+from collections import Counter
+from typing import Optional
+
+import httpx
+import numpy as np
+
+questions = [
+    "Whats the Cash ISA Saver's annual interest rate for an account opened after 18/02/25?",
+    "List all the details of Bob Brown?",
+    "What is the total amount of pending transactions for Bob Brown and round off to 2 decimal places?",
+]
+
+def body(endpoint: str, client: int, i: int) -> dict:
+    question = questions[i % len(questions)]
+    if endpoint == "chat":
+        return {"session_id": f"load-{client}", "message": question}
+    return {"query": question}
+
+async def send(http: httpx.AsyncClient, endpoint: str, payload: dict) -> dict:
+    start = time.perf_counter()
+    first_event_ms = None
+    first_token_ms = None
+    if endpoint == "advisor/stream":
+        async with http.stream("POST", "/" + endpoint, json=payload) as response:
+            status = response.status_code
+            async for line in response.aiter_lines():
+                if first_event_ms is None and line.startswith("event:"):
+                    first_event_ms = (time.perf_counter() - start) * 1000
+                if first_token_ms is None and line == "event: token":
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                if line == "event: error":
+                    status = "stream_error"
+    else:
+        response = await http.post("/" + endpoint, json=payload)
+        status = response.status_code
+    return {
+        "status": status,
+        "ms": (time.perf_counter() - start) * 1000,
+        "first_event_ms": first_event_ms,
+        "first_token_ms": first_token_ms,
+    }
+
+async def load(http: httpx.AsyncClient, endpoint: str, concurrency: int, requests: int) -> dict:
+    results = []
+    counter = iter(range(requests))
+
+    async def client(index: int):
+        for i in counter:
+            try:
+                results.append(await send(http, endpoint, body(endpoint, index, i)))
+            except httpx.HTTPError as e:
+                results.append({"status": type(e).__name__, "ms": None, "first_event_ms": None, "first_token_ms": None})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [r["ms"] for r in results if r["status"] == 200]
+    first_events = [r["first_event_ms"] for r in results if r["first_event_ms"] is not None]
+    first_tokens = [r["first_token_ms"] for r in results if r["first_token_ms"] is not None]
+    report = {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "status": dict(Counter(str(r["status"]) for r in results)),
+        "seconds": round(elapsed, 2),
+        "ok_per_second": round(len(latencies) / elapsed, 1),
+    }
+    if latencies:
+        report.update({f"p{p}_ms": round(float(np.percentile(latencies, p)), 1) for p in (50, 95, 99)})
+    if first_events:
+        report["first_event_p50_ms"] = round(float(np.percentile(first_events, 50)), 1)
+    if first_tokens:
+        report.update({f"first_token_p{p}_ms": round(float(np.percentile(first_tokens, p)), 1) for p in (50, 95)})
+    return report
+
+async def start_local_server():
+    """Serve server.app on a free local port in this event loop (a real server: httpx's ASGITransport buffers streams)."""
+    import uvicorn
+
+    import server
+
+    server.warm_up_on_start = False
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    local = uvicorn.Server(uvicorn.Config(server.app, log_level="warning"))
+    task = asyncio.create_task(local.serve(sockets=[sock]))
+    while not local.started:
+        await asyncio.sleep(0.01)
+    return local, task, "http://127.0.0.1:%d" % sock.getsockname()[1]
+
+async def main(url: Optional[str], endpoint: str, levels: list, requests: int, timeout: float) -> dict:
+    local = None
+    if url is None:
+        local, task, url = await start_local_server()
+    try:
+        limits = httpx.Limits(max_connections=max(levels))
+        async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as http:
+            results = [await load(http, endpoint, concurrency, requests) for concurrency in levels]
+            server_stats = (await http.get("/stats")).json()
+    finally:
+        if local is not None:
+            local.should_exit = True
+            await task
+    return {"endpoint": endpoint, "results": results, "server": server_stats}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="a running server; by default the app is served in this process")
+    parser.add_argument("--endpoint", choices=["chat", "advisor", "advisor/stream"], default="chat")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call (in-process only)")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="seconds per streamed word of a fake answer (in-process only)")
+    parser.add_argument(
+        "--llm-requests-per-second", type=float, default=100,
+        help="LLM rate limit of the advisor (in-process only); the default lifts the Gemini limit of wf_agents",
+    )
+    parser.add_argument("--timeout", type=float, default=600, help="client timeout per request in seconds")
+    args = parser.parse_args()
+
+    if not args.url:
+        from fake_llm import use_fake_llm
+        from wf_agents import llm_rate_limiter
+
+        use_fake_llm(latency=args.llm_latency, token_latency=args.llm_token_latency)
+        llm_rate_limiter.configure(rate=args.llm_requests_per_second, capacity=max(1, int(args.llm_requests_per_second)))
+    report = asyncio.run(main(args.url, args.endpoint, args.concurrency, args.requests, args.timeout))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,78 @@
+"""
+Benchmark the cold-start import time of the app entry points with -X importtime.
+
+Each entry point is imported in a fresh interpreter; the best of --repeats runs
+is reported: wall-clock time of the process, import time of the module itself
+and its slowest top-level imports. Entry points over --budget-ms are listed
+under "over_budget" and make the script exit with status 1, e.g.
+
+    python bench_startup.py --modules wf_agents wf_agents_app --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+entry_points = ["wf_agents", "wf_agents_app", "sub_question_query_engine", "app", "retriever", "customer_db", "pending_tx_agent"]
+
+def parse_importtime(stderr: str) -> list:
+    """(module, self_us, cumulative_us, depth) for each line of -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # nesting is shown as two spaces per level after the "| " separator
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def import_once(module: str) -> dict:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1]}
+    rows = parse_importtime(result.stderr)
+    own = [row for row in rows if row[0] == module]
+    # top-level imports, i.e. packages pulled in directly by some module at depth 0
+    top_level = sorted((row for row in rows if row[3] == 1), key=lambda row: -row[2])
+    return {
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(own[-1][2] / 1000, 1) if own else None,
+        "modules_imported": len(rows),
+        "slowest_imports_ms": {name: round(cumulative / 1000, 1) for name, _, cumulative, _ in top_level[:8]},
+    }
+
+def run(module: str, repeats: int) -> dict:
+    runs = [import_once(module) for _ in range(repeats)]
+    ok = [r for r in runs if "error" not in r]
+    if not ok:
+        return runs[0]
+    return min(ok, key=lambda r: r["wall_ms"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=entry_points)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if an entry point's wall-clock start exceeds this")
+    args = parser.parse_args()
+
+    results = {module: run(module, args.repeats) for module in args.modules}
+    report = {"python": sys.version.split()[0], "results": results}
+    if args.budget_ms is not None:
+        report["budget_ms"] = args.budget_ms
+        report["over_budget"] = [
+            module for module, result in results.items()
+            if "error" in result or result["wall_ms"] > args.budget_ms
+        ]
+    print(json.dumps(report, indent=2))
+    if report.get("over_budget"):
+        sys.exit(1)
@@ -0,0 +1,81 @@
+"""
+Benchmark sequential versus parallel sub-question answering with a fake LLM.
+
+Every LLM call takes --llm-latency seconds and each sub-question's ReAct agent
+calls a tool that takes --tool-latency seconds, so wall-clock time is dominated
+by waiting like with a real model. Reports the wall-clock time of both modes,
+the speedup and how many ReAct agents each run built or reused from the agent
+pool for each number of sub-questions, e.g.
+
+    python bench_sub_questions.py --sub-questions 2 4 8 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from llama_index.core.tools import FunctionTool
+
+from fake_llm import FakeLLM
+from sub_question_query_engine import SubQuestionQueryEngine, react_agent_pool
+
+tool_output = "looked up"
+
+def make_responder(num_sub_questions: int):
+    def respond(prompt: str) -> str:
+        if '"sub_questions"' in prompt:
+            return json.dumps({"sub_questions": [f"Sub-question {i}?" for i in range(num_sub_questions)]})
+        # ReAct: call the tool once, answer once its output is in the history
+        if "Thought:" in prompt and tool_output not in prompt:
+            return 'Thought: I need to use a tool.\nAction: lookup\nAction Input: {"question": "x"}'
+        if "Thought:" in prompt:
+            return "Thought: I can answer without using any more tools.\nAnswer: fake answer"
+        return "final answer"
+    return respond
+
+def make_tool(latency: float) -> FunctionTool:
+    async def lookup(question: str) -> str:
+        """Look up the answer to a question."""
+        await asyncio.sleep(latency)
+        return tool_output
+
+    return FunctionTool.from_defaults(fn=lookup)
+
+async def timed_run(engine: SubQuestionQueryEngine, llm: FakeLLM, tool: FunctionTool) -> dict:
+    calls = llm.calls
+    pool_before = react_agent_pool.stats.summary()
+    start = time.perf_counter()
+    await engine.run(llm=llm, tools=[tool], query="benchmark query")
+    seconds = time.perf_counter() - start
+    pool_after = react_agent_pool.stats.summary()
+    return {
+        "seconds": round(seconds, 3),
+        "llm_calls": llm.calls - calls,
+        "agents_built": pool_after["builds"] - pool_before["builds"],
+        "agents_reused": pool_after["reuses"] - pool_before["reuses"],
+        "build_ms_saved": round((pool_after["reuses"] - pool_before["reuses"]) * pool_after["median_build_ms"], 3),
+    }
+
+def run(num_sub_questions: int, workers: int, llm_latency: float, tool_latency: float, repeats: int = 2) -> dict:
+    # the same LLM and tool across runs, as in the app, so later runs reuse pooled agents
+    llm = FakeLLM(latency=llm_latency, responder=make_responder(num_sub_questions))
+    tool = make_tool(tool_latency)
+    result = {"sub_questions": num_sub_questions, "workers": workers}
+    for mode, parallel in (("sequential", False), ("parallel", True)):
+        engine = SubQuestionQueryEngine(timeout=600, parallel=parallel, num_workers=workers)
+        result[mode] = [asyncio.run(timed_run(engine, llm, tool)) for _ in range(repeats)]
+    result["speedup"] = round(result["sequential"][-1]["seconds"] / result["parallel"][-1]["seconds"], 2)
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sub-questions", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--tool-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    # first run pays for imports and prompt setup
+    run(1, args.workers, 0.0, 0.0)
+    for n in args.sub_questions:
+        print(json.dumps(run(n, args.workers, args.llm_latency, args.tool_latency), indent=2))
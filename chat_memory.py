@@ -0,0 +1,177 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.memory.types import BaseChatStoreMemory
+from llama_index.core.storage.chat_store.loading import load_chat_store
+
+from async_tools import acomplete
+
+# estimated tokens of recent turns kept verbatim, and of the rolling summary of older ones
+memory_token_limit = 3000
+memory_summary_token_limit = 500
+
+# AgentWorkflow prefixes each user message with the current state, up to this marker
+state_marker = "Current message:\n"
+
+# LLM used to summarize when a memory has none of its own (e.g. restored from disk)
+default_summary_llm = None
+
+summary_prompt = """Update the summary of a conversation between a bank customer and a banking assistant.
+Keep every fact the assistant may need later (customer names and ids, amounts, rates, dates, what was asked and answered).
+Answer with the new summary only, in at most {words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+def set_summary_llm(llm):
+    global default_summary_llm
+    default_summary_llm = llm
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+def message_tokens(messages: List[ChatMessage]) -> int:
+    return sum(estimate_tokens(str(message.content or "")) + 4 for message in messages)
+
+def format_messages(messages: List[ChatMessage]) -> str:
+    return "\n".join(f"{message.role.value}: {message.content or ''}" for message in messages if message.content)
+
+def strip_state(content: str) -> str:
+    """The customer's words of a user message, without the state AgentWorkflow put in front."""
+    head, marker, tail = content.partition(state_marker)
+    return tail.strip() if marker and head.startswith("Current state:") else content
+
+class BoundedChatMemory(BaseChatStoreMemory):
+    """
+    Chat memory whose prompt size stays flat however long the session runs.
+
+    Only the latest user message keeps the `state` block AgentWorkflow puts in
+    front of it (interest_rates, customer_details, pending_tx_details...), so
+    the structured state is sent once per turn instead of once per past turn.
+    When the messages go over `token_limit`, the oldest whole turns (a user
+    message and the tool calls and answers that followed it) are folded into a
+    rolling summary sent as a system message ahead of the recent turns.
+    """
+
+    token_limit: int = Field(default=memory_token_limit, gt=0)
+    summary_token_limit: int = Field(default=memory_summary_token_limit, gt=0)
+    summary: str = Field(default="")
+    summarized_messages: int = Field(default=0)
+
+    _llm: Any = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BoundedChatMemory"
+
+    @classmethod
+    def from_defaults(
+        cls,
+        chat_history: Optional[List[ChatMessage]] = None,
+        llm: Optional[Any] = None,
+        token_limit: int = memory_token_limit,
+        summary_token_limit: int = memory_summary_token_limit,
+        **kwargs: Any,
+    ) -> "BoundedChatMemory":
+        memory = cls(token_limit=token_limit, summary_token_limit=summary_token_limit, **kwargs)
+        memory._llm = llm
+        if chat_history:
+            memory.set(chat_history)
+        return memory
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], **kwargs: Any) -> "BoundedChatMemory":
+        # sessions restored from disk: the chat store comes back as a plain dict
+        data = dict(data)
+        if "chat_store" in data:
+            data["chat_store"] = load_chat_store(data["chat_store"])
+        return cls(**data)
+
+    @property
+    def llm(self):
+        return self._llm or default_summary_llm
+
+    def get(self, input: Optional[str] = None, **kwargs: Any) -> List[ChatMessage]:
+        messages = self.get_all()
+        if self.summary:
+            summary = ChatMessage(role=MessageRole.SYSTEM, content="Summary of the earlier conversation:\n" + self.summary)
+            return [summary] + messages
+        return messages
+
+    def put(self, message: ChatMessage) -> None:
+        super().put(message)
+        self._compact(self._extract_summary)
+
+    async def aput(self, message: ChatMessage) -> None:
+        await super().aput(message)
+        old = self._take_old_turns()
+        if old:
+            self._set_summary(await self._llm_summary(old) if self.llm else self._extract_summary(old))
+
+    def set(self, messages: List[ChatMessage]) -> None:
+        super().set(messages)
+        self._compact(self._extract_summary)
+
+    def reset(self) -> None:
+        super().reset()
+        self.summary = ""
+        self.summarized_messages = 0
+
+    def _compact(self, summarize: Callable[[List[ChatMessage]], str]):
+        old = self._take_old_turns()
+        if old:
+            self._set_summary(summarize(old))
+
+    def _take_old_turns(self) -> List[ChatMessage]:
+        """Drop stale state, then remove and return the oldest turns over the token limit."""
+        messages = self.get_all()
+        user_indices = [i for i, message in enumerate(messages) if message.role == MessageRole.USER]
+        changed = False
+        for i in user_indices[:-1]:
+            content = messages[i].content
+            if isinstance(content, str) and strip_state(content) != content:
+                messages[i] = ChatMessage(role=MessageRole.USER, content=strip_state(content))
+                changed = True
+        # cut only at user messages, so tool results are never split from their calls;
+        # the current turn is always kept, even when it alone is over the limit
+        cut = 0
+        for start in user_indices[1:]:
+            if message_tokens(messages[cut:]) <= self.token_limit:
+                break
+            cut = start
+        if cut or changed:
+            super().set(messages[cut:])
+        return messages[:cut]
+
+    def _set_summary(self, summary: str):
+        # the summary has a budget too: keep its most recent part
+        self.summary = summary.strip()[-self.summary_token_limit * 4:]
+
+    def _extract_summary(self, messages: List[ChatMessage]) -> str:
+        self.summarized_messages += len(messages)
+        lines = [
+            f"{message.role.value}: {str(message.content)[:200]}"
+            for message in messages
+            if message.content and message.role in (MessageRole.USER, MessageRole.ASSISTANT)
+        ]
+        return "\n".join(filter(None, [self.summary] + lines))
+
+    async def _llm_summary(self, messages: List[ChatMessage]) -> str:
+        prompt = summary_prompt.format(
+            words=self.summary_token_limit * 3 // 4,
+            summary=self.summary or "(none)",
+            messages=format_messages(messages),
+        )
+        try:
+            summary = str(await acomplete(self.llm, prompt))
+        except Exception as e:
+            # a failed summary must not fail the customer's turn
+            print(f"Summarizing the conversation failed, keeping an extract: {e}")
+            return self._extract_summary(messages)
+        self.summarized_messages += len(messages)
+        return summary
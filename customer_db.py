@@ -1,76 +1,304 @@
-from llama_index.core import SQLDatabase, Settings
-from llama_index.llms.gemini import Gemini
+from llama_index.core import MockEmbedding, SQLDatabase, Settings
 from sqlalchemy import (
     create_engine,
+    event,
+    select,
     MetaData,
     Table,
     Column,
+    Index,
     String,
     Integer,
+    Date,
+    inspect,
 )
 from llama_index.core.query_engine import NLSQLTableQueryEngine
+from sql_cache import SQLTemplateCache
+from services import services
+from lazy_llm import LazyLLM
 from sqlalchemy import insert
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+import argparse
+import csv
+import itertools
 import os
+import time
+import weakref
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-def create_banking_customer_db():
-    """
-    Creates and populates a banking customer database, returns the query engine
-    """
-    Settings.llm = Gemini(model="models/gemini-2.0-pro-exp-02-05",api_key=GOOGLE_API_KEY)
-    engine = create_engine("sqlite:///:memory:", future=True)
-    metadata_obj = MetaData()
-
-    customer_table = Table(
-        "customer",
-        metadata_obj,
-        Column("customer_id", String(16), primary_key=True),
-        Column("customer_name", String(50), nullable=False),
-        Column("customer_address", String(50), nullable=False),
-        Column("customer_phone", String(50)),
-        Column("customer_email", String(50)),
-        Column("customer_dob", String(50)),
-        Column("customer_gender", String(50)),
-        Column("customer_nationality", String(50)),
-        Column("customer_occupation", String(50)),
-        Column("customer_income", String(50)),
-        Column("account_balance", String(50)),
-        
+customer_db_path = "./customer.db"
+
+# rows per executemany call while bulk loading
+customer_load_batch_size = 50_000
+
+# concurrent customer queries (worker threads) and the connections available to them
+customer_db_max_concurrency = 8
+customer_db_pool_size = 8
+
+# text-to-SQL template cache; without synthesis cache hits return the rows as text with no LLM call
+sql_template_cache_size = 1000
+synthesize_customer_response = True
+
+metadata_obj = MetaData()
+
+customer_table = Table(
+    "customer",
+    metadata_obj,
+    # the primary key is the customer_id index
+    Column("customer_id", String(16), primary_key=True),
+    Column("customer_name", String(50), nullable=False),
+    Column("customer_address", String(50), nullable=False),
+    Column("customer_phone", String(50)),
+    Column("customer_email", String(50)),
+    Column("customer_dob", Date),
+    Column("customer_gender", String(50)),
+    Column("customer_nationality", String(50)),
+    Column("customer_occupation", String(50)),
+    # money is stored in minor units (pence) of `currency`
+    Column("customer_income", Integer),
+    Column("account_balance", Integer),
+    Column("currency", String(3), nullable=False, server_default="GBP"),
+    Index("ix_customer_name", "customer_name"),
+    Index("ix_customer_email", "customer_email"),
+    Index("ix_account_balance", "account_balance"),
+    Index("ix_customer_income", "customer_income"),
+)
+
+# passed to the text-to-SQL prompt so the LLM filters and aggregates the integer columns directly
+customer_table_context = (
+    "customer_income and account_balance are integers in minor units (pence) of the "
+    "currency column, e.g. 1500000 is £15,000.00: compare and aggregate them directly "
+    "and divide by 100 only to present amounts. customer_dob is a DATE (YYYY-MM-DD)."
+)
+
+currency_symbols = {"£": "GBP", "$": "USD", "€": "EUR"}
+
+# units of the money values in each input: Python rows (seed_customers, load_customers) are
+# in minor units like the table, CSV files and legacy string columns in major units
+money_unit_scale = {"minor": 1, "major": 100}
+
+default_currency = "GBP"
+
+customer_columns = [column.name for column in customer_table.columns]
+
+# Customers are from the UK
+seed_customers = [
+    {"customer_id": "C001", "customer_name": "John Smith", "customer_address": "123 Oak St, London, UK", "customer_phone": "123-456-7890", "customer_email": "john.smith@example.com", "customer_dob": "1980-01-15", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Engineer", "customer_income": 6000000, "account_balance": 1500000, "currency": "GBP"},
+    {"customer_id": "C003", "customer_name": "Alice Johnson", "customer_address": "789 Pine St, Anytown, UK", "customer_phone": "123-456-7892", "customer_email": "alice.johnson@example.com", "customer_dob": "1992-03-20", "customer_gender": "Female", "customer_nationality": "UK", "customer_occupation": "Teacher", "customer_income": 4000000, "account_balance": 800000, "currency": "GBP"},
+    {"customer_id": "C004", "customer_name": "Bob Brown", "customer_address": "123 Main St, Anytown, UK", "customer_phone": "123-456-7893", "customer_email": "bob.brown@example.com", "customer_dob": "1985-05-15", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Doctor", "customer_income": 7000000, "account_balance": 2500000, "currency": "GBP"},
+    {"customer_id": "C005", "customer_name": "Charlie Davis", "customer_address": "456 Oak Ave, Anycity, UK", "customer_phone": "123-456-7894", "customer_email": "charlie.davis@example.com", "customer_dob": "1990-01-01", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Software Engineer", "customer_income": 5000000, "account_balance": 1200000, "currency": "GBP"},
+    {"customer_id": "C006", "customer_name": "Tom Johns", "customer_address": "789 Pine St, Anytown, UK", "customer_phone": "123-456-7895", "customer_email": "tom.johns@example.com", "customer_dob": "1992-03-20", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Teacher", "customer_income": 4000000, "account_balance": 750000, "currency": "GBP"},
+    {"customer_id": "C007", "customer_name": "Jane Fonda", "customer_address": "123 Main St, Anytown, UK", "customer_phone": "123-456-7896", "customer_email": "jane.fonda@example.com", "customer_dob": "1985-05-15", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Doctor", "customer_income": 7000000, "account_balance": 3000000, "currency": "GBP"},
+]
+
+def parse_money(value, units: str = "major"):
+    """
+    Converts "£15000", "15,000.50" or 15000.5 given in `units` ("major" or "minor") to
+    (minor units, currency or None)
+    """
+    if value is None or value == "":
+        return None, None
+    currency = None
+    if isinstance(value, str):
+        value = value.strip().replace(",", "")
+        if value[:1] in currency_symbols:
+            currency = currency_symbols[value[0]]
+            value = value[1:]
+    minor = Decimal(str(value)) * money_unit_scale[units]
+    if minor != minor.to_integral_value():
+        raise ValueError(f"{value!r} is not a whole number of minor units")
+    return int(minor), currency
+
+def parse_date(value):
+    """
+    Converts a date or "YYYY-MM-DD" to the ISO text SQLite stores for a Date column
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        value = value.date()
+    if not isinstance(value, date):
+        value = date.fromisoformat(str(value).strip()[:10])
+    return value.isoformat()
+
+def customer_values(row: dict, money_units: str = "minor") -> tuple:
+    """
+    Converts a customer dict to a tuple in customer_columns order. All its money values, ints
+    or strings ("£15000"), are in `money_units` ("minor" or "major").
+    """
+    values = dict(row)
+    currency = values.get("currency") or None
+    for column in ("customer_income", "account_balance"):
+        values[column], symbol_currency = parse_money(values.get(column), money_units)
+        currency = currency or symbol_currency
+    values["currency"] = currency or default_currency
+    values["customer_dob"] = parse_date(values.get("customer_dob"))
+    return tuple(None if values.get(column) == "" else values.get(column) for column in customer_columns)
+
+# open engines; SQLite connections must not cross a fork: a forked worker opens its own
+_customer_engines = weakref.WeakSet()
+
+def _dispose_engines_after_fork():
+    for engine in list(_customer_engines):
+        engine.dispose(close=False)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+def create_customer_engine(db_path: str = customer_db_path):
+    """
+    Opens (and creates or migrates if needed) the file-backed customer database
+    """
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        future=True,
+        pool_size=customer_db_pool_size,
+        max_overflow=0,
     )
 
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # readers don't block the bulk loader and vice versa
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.close()
+
+    _customer_engines.add(engine)
+    migrate_customer_db(engine)
     metadata_obj.create_all(engine)
+    return engine
+
+def migrate_customer_db(engine) -> int:
+    """
+    Converts a customer table with string money/dates ("£15000") to the typed schema, returns
+    the number of migrated rows (0 if there was nothing to migrate)
+    """
+    inspector = inspect(engine)
+    if "customer" not in inspector.get_table_names():
+        return 0
+    if "currency" in {column["name"] for column in inspector.get_columns("customer")}:
+        return 0
+
+    print("Migrating customer table to typed money and date columns")
+    count = 0
+    legacy_indexes = [index["name"] for index in inspector.get_indexes("customer")]
+    with engine.begin() as connection:
+        # the new table reuses the index names
+        for name in legacy_indexes:
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        connection.exec_driver_sql("ALTER TABLE customer RENAME TO customer_legacy")
+        customer_table.create(connection)
+        result = connection.exec_driver_sql("SELECT * FROM customer_legacy")
+        columns = list(result.keys())
+        while batch := result.fetchmany(customer_load_batch_size):
+            insert_customer_rows(connection, [customer_values(dict(zip(columns, row)), "major") for row in batch])
+            count += len(batch)
+        connection.exec_driver_sql("DROP TABLE customer_legacy")
+    return count
+
+def insert_customer_rows(connection, rows):
+    # straight to the driver's executemany: building a SQLAlchemy parameter set per row dominates at 1M rows
+    connection.exec_driver_sql(
+        f"INSERT OR REPLACE INTO customer ({', '.join(customer_columns)}) "
+        f"VALUES ({', '.join('?' * len(customer_columns))})",
+        rows,
+    )
+
+def load_customers(engine, rows, batch_size: int = customer_load_batch_size, money_units: str = "minor") -> int:
+    """
+    Bulk-inserts (or replaces) customer dicts in a single transaction, returns the row count.
+    Their money values are in `money_units` (minor units, pence, by default).
+    """
+    count = 0
+    rows = iter(rows)
+    with engine.begin() as connection:
+        # into an empty table it is cheaper to build the secondary indexes once at the end
+        rebuild_indexes = connection.execute(select(customer_table.c.customer_id).limit(1)).first() is None
+        if rebuild_indexes:
+            for index in customer_table.indexes:
+                index.drop(connection)
+        while batch := list(itertools.islice(rows, batch_size)):
+            insert_customer_rows(connection, [customer_values(row, money_units) for row in batch])
+            count += len(batch)
+        if rebuild_indexes:
+            for index in customer_table.indexes:
+                index.create(connection)
+    return count
 
-    # Insert data into the customer table. Customers are from the UK
+def load_customers_csv(engine, csv_path: str, batch_size: int = customer_load_batch_size, money_units: str = "major") -> int:
+    """
+    Streams a CSV of customers (a header with the customer table's columns) into the database.
+    Its money values ("£15000", "15,000.50") are in `money_units` (major units by default).
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return load_customers(engine, csv.DictReader(f), batch_size, money_units)
 
-    rows = [
-        {"customer_id": "C001", "customer_name": "John Smith", "customer_address": "123 Oak St, London, UK", "customer_phone": "123-456-7890", "customer_email": "john.smith@example.com", "customer_dob": "1980-01-15", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Engineer", "customer_income": "£60000", "account_balance": "£15000"},
-        {"customer_id": "C003", "customer_name": "Alice Johnson", "customer_address": "789 Pine St, Anytown, UK", "customer_phone": "123-456-7892", "customer_email": "alice.johnson@example.com", "customer_dob": "1992-03-20", "customer_gender": "Female", "customer_nationality": "UK", "customer_occupation": "Teacher", "customer_income": "£40000", "account_balance": "£8000"},
-        {"customer_id": "C004", "customer_name": "Bob Brown", "customer_address": "123 Main St, Anytown, UK", "customer_phone": "123-456-7893", "customer_email": "bob.brown@example.com", "customer_dob": "1985-05-15", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Doctor", "customer_income": "£70000", "account_balance": "£25000"},
-        {"customer_id": "C005", "customer_name": "Charlie Davis", "customer_address": "456 Oak Ave, Anycity, UK", "customer_phone": "123-456-7894", "customer_email": "charlie.davis@example.com", "customer_dob": "1990-01-01", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Software Engineer", "customer_income": "£50000", "account_balance": "£12000"},
-        {"customer_id": "C006", "customer_name": "Tom Johns", "customer_address": "789 Pine St, Anytown, UK", "customer_phone": "123-456-7895", "customer_email": "tom.johns@example.com", "customer_dob": "1992-03-20", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Teacher", "customer_income": "£40000", "account_balance": "£7500"},
-        {"customer_id": "C007", "customer_name": "Jane Fonda", "customer_address": "123 Main St, Anytown, UK", "customer_phone": "123-456-7896", "customer_email": "jane.fonda@example.com", "customer_dob": "1985-05-15", "customer_gender": "Male", "customer_nationality": "UK", "customer_occupation": "Doctor", "customer_income": "£70000", "account_balance": "£30000"},
-    ]
+def seed_customer_db(engine) -> int:
+    """
+    Inserts the sample customers, only into an empty table
+    """
+    with engine.connect() as connection:
+        if connection.execute(select(customer_table.c.customer_id).limit(1)).first() is not None:
+            return 0
+    return load_customers(engine, seed_customers)
 
-    for row in rows:
-        stmt = insert(customer_table).values(**row)
-        with engine.begin() as connection:
-            connection.execute(stmt)
+def create_banking_customer_db(
+    db_path: str = customer_db_path,
+    csv_path: str = None,
+    synthesize_response: bool = synthesize_customer_response,
+):
+    """
+    Opens the banking customer database (seeding it on first use), returns the query engine
+    """
+    Settings.llm = LazyLLM("customer_db.llm")
+    engine = create_customer_engine(db_path)
+    if csv_path:
+        load_customers_csv(engine, csv_path)
+    else:
+        seed_customer_db(engine)
 
     sql_database = SQLDatabase(engine, include_tables=["customer"])
     
-    return NLSQLTableQueryEngine(
+    query_engine = NLSQLTableQueryEngine(
         sql_database=sql_database,
-        tables=["customer"]
+        tables=["customer"],
+        context_query_kwargs={"customer": customer_table_context},
+        synthesize_response=synthesize_response,
+        # only the pgvector SQL parser embeds anything: don't build an embedding client for it
+        embed_model=MockEmbedding(embed_dim=1),
+    )
+    return SQLTemplateCache(
+        query_engine,
+        sql_database,
+        synthesize=synthesize_response,
+        max_templates=sql_template_cache_size,
+        executor=ThreadPoolExecutor(max_workers=customer_db_max_concurrency, thread_name_prefix="customer-db"),
     )
 
-# Example usage:
-# if __name__ == "__main__":
-#     query_engine = create_banking_customer_db()
-#     # Use a clear natural language query format
-#     query = "List all the details of Bob Brown?"
-#     response = query_engine.query(query)
-#     print(response)
\ No newline at end of file
+def create_llm():
+    from llama_index.llms.gemini import Gemini
+    return Gemini(model="models/gemini-2.0-pro-exp-02-05",api_key=GOOGLE_API_KEY)
+
+# the Gemini client and the default customer DB engine are built on first use
+services.register("customer_db.llm", create_llm, per_process=True)
+services.register("customer_db.query_engine", create_banking_customer_db)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load customers into the customer database")
+    parser.add_argument("csv_path", help="CSV file with the customer table's columns as header")
+    parser.add_argument("--db", default=customer_db_path)
+    parser.add_argument("--money-units", choices=sorted(money_unit_scale), default="major",
+                        help="units of the CSV's income and balance values")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = load_customers_csv(create_customer_engine(args.db), args.csv_path, money_units=args.money_units)
+    print(f"Loaded {count} customers into {args.db} in {time.perf_counter() - start:.1f}s")
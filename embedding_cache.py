@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+default_cache_path = "./embedding_cache.db"
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model name, text hash), stored in SQLite.
+    """
+
+    def __init__(self, path: str = default_cache_path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # stay well below SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                for row_hash, blob in rows:
+                    vector = array("d")
+                    vector.frombytes(blob)
+                    found[row_hash] = vector.tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        rows = [(model, h, array("d", vector).tobytes()) for h, vector in items.items()]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    rows,
+                )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class EmbeddingStats:
+    """Cache hit rate and per-batch latency of an embedding model."""
+
+    def __init__(self, max_samples: int = 1000):
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batch_latencies = deque(maxlen=max_samples)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def record_batch(self, seconds: float):
+        self.batches += 1
+        self.batch_latencies.append(seconds)
+
+    def summary(self) -> dict:
+        latencies = sorted(self.batch_latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "batches": self.batches,
+            "batch_latency_p50_ms": round(percentile(0.5) * 1000, 2),
+            "batch_latency_p99_ms": round(percentile(0.99) * 1000, 2),
+        }
+
+class CachedBatchEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model with a persistent cache and batched, concurrent calls.
+
+    Texts already in the cache are never sent to the wrapped model. The rest are
+    de-duplicated, split into batches of `batch_size` and embedded with at most
+    `max_concurrency` batches in flight.
+    """
+
+    batch_size: int = Field(default=100, gt=0)
+    max_concurrency: int = Field(default=4, gt=0)
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _stats: EmbeddingStats = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = 100,
+        max_concurrency: int = 4,
+        **kwargs: Any,
+    ):
+        # batching is done here, so let BaseEmbedding hand us everything at once
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=2048,
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache or EmbeddingCache()
+        self._stats = EmbeddingStats()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedBatchEmbedding"
+
+    @property
+    def stats(self) -> EmbeddingStats:
+        return self._stats
+
+    def _lookup(self, namespace: str, texts: List[str]):
+        """Return (text hashes, embeddings with None for misses, {hash: text} still to embed)."""
+        hashes = [text_hash(text) for text in texts]
+        cached = self._cache.get_many(namespace, list(set(hashes)))
+        embeddings = [cached.get(h) for h in hashes]
+        missing = {}
+        for h, text, embedding in zip(hashes, texts, embeddings):
+            if embedding is None:
+                missing[h] = text
+        self._stats.hits += len(texts) - sum(1 for e in embeddings if e is None)
+        self._stats.misses += len(missing)
+        return hashes, embeddings, missing
+
+    def _batches(self, missing: Dict[str, str]):
+        items = list(missing.items())
+        return [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+    async def _aembed_missing(self, namespace: str, missing: Dict[str, str]) -> Dict[str, List[float]]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed_batch(batch):
+            async with semaphore:
+                start = time.perf_counter()
+                # one request per batch: the public batch method would split it again by the
+                # wrapped model's embed_batch_size and send the pieces all at once
+                vectors = await self._embed_model._aget_text_embeddings([text for _, text in batch])
+                self._stats.record_batch(time.perf_counter() - start)
+            result = {h: vector for (h, _), vector in zip(batch, vectors)}
+            self._cache.put_many(namespace, result)
+            return result
+
+        results = await asyncio.gather(*[embed_batch(batch) for batch in self._batches(missing)])
+        return {h: vector for result in results for h, vector in result.items()}
+
+    def _embed_missing(self, namespace: str, missing: Dict[str, str]) -> Dict[str, List[float]]:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._aembed_missing(namespace, missing))
+
+        # called synchronously from inside an event loop: fall back to one batch at a time
+        result = {}
+        for batch in self._batches(missing):
+            start = time.perf_counter()
+            vectors = self._embed_model._get_text_embeddings([text for _, text in batch])
+            self._stats.record_batch(time.perf_counter() - start)
+            embedded = {h: vector for (h, _), vector in zip(batch, vectors)}
+            self._cache.put_many(namespace, embedded)
+            result.update(embedded)
+        return result
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        hashes, embeddings, missing = self._lookup(self.model_name, texts)
+        if missing:
+            embedded = self._embed_missing(self.model_name, missing)
+            embeddings = [e if e is not None else embedded[h] for h, e in zip(hashes, embeddings)]
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        hashes, embeddings, missing = self._lookup(self.model_name, texts)
+        if missing:
+            embedded = await self._aembed_missing(self.model_name, missing)
+            embeddings = [e if e is not None else embedded[h] for h, e in zip(hashes, embeddings)]
+        return embeddings
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _query_namespace(self) -> str:
+        # query and document embeddings can differ (e.g. Gemini task types)
+        return self.model_name + ":query"
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        namespace = self._query_namespace()
+        hashes, embeddings, missing = self._lookup(namespace, [query])
+        if embeddings[0] is not None:
+            return embeddings[0]
+        start = time.perf_counter()
+        embedding = self._embed_model.get_query_embedding(query)
+        self._stats.record_batch(time.perf_counter() - start)
+        self._cache.put_many(namespace, {hashes[0]: embedding})
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        namespace = self._query_namespace()
+        hashes, embeddings, missing = self._lookup(namespace, [query])
+        if embeddings[0] is not None:
+            return embeddings[0]
+        start = time.perf_counter()
+        embedding = await self._embed_model.aget_query_embedding(query)
+        self._stats.record_batch(time.perf_counter() - start)
+        self._cache.put_many(namespace, {hashes[0]: embedding})
+        return embedding
+
+class HashEmbedding(BaseEmbedding):
+    """
+    Deterministic local embedding model for tests and benchmarks.
+
+    Vectors are derived from the sha256 of the text, so identical text always maps
+    to the same unit vector. `latency` simulates a network round trip per call.
+    """
+
+    embed_dim: int = Field(default=64, gt=0)
+    latency: float = Field(default=0.0, ge=0.0)
+
+    _calls: int = PrivateAttr(default=0)
+
+    def __init__(self, embed_dim: int = 64, latency: float = 0.0, **kwargs: Any):
+        kwargs.setdefault("model_name", f"hash-{embed_dim}")
+        super().__init__(embed_dim=embed_dim, latency=latency, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _vector(self, text: str) -> List[float]:
+        values = []
+        counter = 0
+        while len(values) < self.embed_dim:
+            digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            values.extend((b - 127.5) / 127.5 for b in digest)
+            counter += 1
+        values = values[:self.embed_dim]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._aget_text_embedding(query)
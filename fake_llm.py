@@ -0,0 +1,302 @@
+import ast
+import asyncio
+import json
+import re
+import time
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+from llama_index.core.base.llms.generic_utils import completion_response_to_chat_response
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+from llama_index.core.llms.llm import ToolSelection
+
+customer_name_pattern = re.compile(r"\b([A-Z][a-z]+ [A-Z][a-z]+)\b")
+word_pattern = re.compile(r"[a-z]{4,}")
+react_tool_pattern = re.compile(r"> Tool Name: (\S+)\nTool Description: (.*?)\nTool Args: (.*?)\n", re.DOTALL)
+
+def default_response(prompt: str) -> str:
+    """Plausible canned output for the prompts this repo sends."""
+    if '"sub_questions"' in prompt:
+        return json.dumps({"sub_questions": [
+            "What is the ISA interest rate?",
+            "What is Bob Brown's account balance?",
+            "What are Bob Brown's pending transactions?",
+        ]})
+    # the advisor's plan and question for a query: the query itself
+    if "expert in formulating plans" in prompt:
+        return prompt.rsplit(" : ", 1)[-1].strip()
+    outline = re.search(r"based on the outline: (.*?)\. Generate only 1 question", prompt, re.DOTALL)
+    if outline:
+        return outline.group(1).strip()
+    # the advisor's review accepts the answer
+    if "return just the string 'OKAY'" in prompt:
+        return "OKAY"
+    # text-to-SQL of customer_db: look up the customer named in the question
+    if "syntactically correct" in prompt and "SQLQuery:" in prompt:
+        names = customer_name_pattern.findall(prompt.rsplit("Question:", 1)[-1])
+        if names:
+            return f"SELECT customer_name, account_balance FROM customer WHERE customer_name = '{names[0]}'"
+        return "SELECT customer_name, account_balance FROM customer LIMIT 5"
+    # PandasQueryEngine of pending_tx_agent
+    if "pandas dataframe" in prompt and "Expression:" in prompt:
+        return "df['pending_amount'].sum()"
+    # ReAct agents parse "Thought: ... Answer: ..."
+    if "Thought:" in prompt:
+        return "Thought: I can answer without using any more tools.\nAnswer: fake answer"
+    return "fake answer"
+
+class FakeLLM(CustomLLM, FunctionCallingLLM):
+    """
+    Local stand-in LLM for benchmarks: answers after `latency` seconds without any API call.
+
+    The async methods sleep with asyncio, so concurrent calls overlap like real
+    network calls, and astream_complete streams the answer word by word, one
+    word every `token_latency` seconds after the first. `responder` maps a
+    prompt to the text to return. It passes as
+    a function calling model but never calls a tool, so function calling agents
+    take its reply as their answer.
+    """
+
+    latency: float = Field(default=0.05, ge=0.0)
+    token_latency: float = Field(default=0.0, ge=0.0)
+
+    _responder: Callable[[str], str] = PrivateAttr()
+    _calls: int = PrivateAttr(default=0)
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        responder: Optional[Callable[[str], str]] = None,
+        token_latency: float = 0.0,
+        **kwargs: Any,
+    ):
+        super().__init__(latency=latency, token_latency=token_latency, **kwargs)
+        self._responder = responder or default_response
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake", is_chat_model=False, is_function_calling_model=True)
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _respond(self, prompt: str) -> CompletionResponse:
+        self._calls += 1
+        return CompletionResponse(text=self._responder(prompt))
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        response = self.complete(prompt, formatted=formatted, **kwargs)
+
+        def gen() -> CompletionResponseGen:
+            yield CompletionResponse(text=response.text, delta=response.text)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        prompt = self.messages_to_prompt(messages)
+        return completion_response_to_chat_response(await self.acomplete(prompt, formatted=True))
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        response = await self.acomplete(prompt, formatted=formatted, **kwargs)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            text = ""
+            for i, word in enumerate(re.findall(r"\S+\s*", response.text)):
+                if i and self.token_latency:
+                    await asyncio.sleep(self.token_latency)
+                text += word
+                yield CompletionResponse(text=text, delta=word)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        response = await self.achat(messages, **kwargs)
+
+        async def gen() -> ChatResponseAsyncGen:
+            yield ChatResponse(message=response.message, delta=response.message.content)
+
+        return gen()
+
+    def _prepare_chat_with_tools(
+        self,
+        tools: Sequence[Any],
+        user_msg: Optional[Union[str, ChatMessage]] = None,
+        chat_history: Optional[List[ChatMessage]] = None,
+        **kwargs: Any,
+    ) -> dict:
+        messages = list(chat_history or [])
+        if isinstance(user_msg, str):
+            user_msg = ChatMessage(role=MessageRole.USER, content=user_msg)
+        if user_msg is not None:
+            messages.append(user_msg)
+        return {"messages": messages, "tools": tools}
+
+    def get_tool_calls_from_response(self, response: ChatResponse, error_on_no_tool_call: bool = True, **kwargs: Any) -> list:
+        if error_on_no_tool_call:
+            raise ValueError("FakeLLM never calls tools")
+        return []
+
+def best_match(question: str, candidates: dict) -> str:
+    """The candidate (name -> description) sharing the most words with the question, the first on a tie."""
+    def words(text: str) -> set:
+        # CustomerDetailsAgent and customer_details both count as "customer details"
+        return set(word_pattern.findall(re.sub(r"(?<=[a-z])(?=[A-Z])", " ", text).replace("_", " ").lower()))
+
+    question_words = words(question)
+    return max(candidates, key=lambda name: len(question_words & words(f"{name} {candidates[name]}")))
+
+def turn_of(messages: Sequence[ChatMessage]):
+    """The customer's question (without AgentWorkflow's state) and the tools called since they asked it, in order."""
+    from chat_memory import strip_state
+
+    question, called = "", []
+    for message in messages:
+        if message.role == MessageRole.USER:
+            question, called = strip_state(str(message.content or "")), []
+        elif message.role == MessageRole.TOOL:
+            called.append(str(message.additional_kwargs.get("tool_call_id", "")).rsplit(":", 1)[0])
+    return question, called
+
+def scripted_tool_calls(messages: Sequence[ChatMessage], tools: Sequence[Any]) -> List[ToolSelection]:
+    """
+    Canned tool calls of a function calling agent's turn. In a multi-agent
+    workflow the routing agent (the one that can hand off to several agents)
+    hands off to the agent whose description best matches the question, and
+    an agent that can only hand back to it does so if it starts the turn.
+    Then one tool best matching the question is called, and the agent
+    answers (no tool calls).
+    """
+    question, called = turn_of(messages)
+    handoffs = called.count("handoff")
+    tools = {tool.metadata.name: tool for tool in tools}
+    if "handoff" in tools and handoffs == len(called) and handoffs < 2:
+        # the handoff tool's description lists the agents as a {name: description} dict
+        description = tools["handoff"].metadata.description
+        try:
+            agents = ast.literal_eval(description[description.index("{"):description.rindex("}") + 1])
+        except (ValueError, SyntaxError):
+            agents = {}
+        if len(agents) > 1 or (agents and not handoffs):
+            to_agent = best_match(question, agents)
+            return [ToolSelection(tool_id=f"handoff:{handoffs}", tool_name="handoff", tool_kwargs={"to_agent": to_agent, "reason": question})]
+    candidates = {name: tool.metadata.description for name, tool in tools.items() if name != "handoff"}
+    if not candidates or handoffs < len(called):
+        return []
+    name = best_match(question, candidates)
+    properties = tools[name].metadata.get_parameters_dict().get("properties", {})
+    kwargs = {arg: question for arg, schema in properties.items() if schema.get("type") == "string"}
+    return [ToolSelection(tool_id=f"{name}:0", tool_name=name, tool_kwargs=kwargs)]
+
+def scripted_response(prompt: str) -> str:
+    """default_response, except that ReAct agents first call the tool best matching the question."""
+    tools = react_tool_pattern.findall(prompt)
+    # the format instructions mention observations too: look at the conversation only
+    conversation = prompt.rsplit("## Current Conversation", 1)[-1]
+    if "Thought:" in prompt and tools and "Observation:" not in conversation and "user: " in conversation:
+        question = conversation.split("user: ", 1)[1].split("\n", 1)[0]
+        name = best_match(question, {name: description for name, description, _ in tools})
+        args = next(args for tool_name, _, args in tools if tool_name == name)
+        try:
+            properties = json.loads(args).get("properties", {})
+        except ValueError:
+            properties = {}
+        action_input = {arg: question.strip() for arg, schema in properties.items() if schema.get("type") == "string"}
+        return f"Thought: I need to use a tool to help me answer the question.\nAction: {name}\nAction Input: {json.dumps(action_input)}"
+    return default_response(prompt)
+
+class ScriptedLLM(FakeLLM):
+    """
+    FakeLLM that also calls tools, so agents run their tools as with a real model.
+
+    `tool_script(messages, tools)` returns the tool calls of a function calling
+    agent's chat (none: the agent answers); the default is scripted_tool_calls,
+    and ReAct agents get theirs from scripted_response. Answers stream at
+    `tokens_per_second` words per second after the first.
+    """
+
+    _tool_script: Callable[[Sequence[ChatMessage], Sequence[Any]], List[ToolSelection]] = PrivateAttr()
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        tokens_per_second: Optional[float] = None,
+        tool_script: Optional[Callable[[Sequence[ChatMessage], Sequence[Any]], List[ToolSelection]]] = None,
+        responder: Optional[Callable[[str], str]] = None,
+        **kwargs: Any,
+    ):
+        token_latency = 1.0 / tokens_per_second if tokens_per_second else 0.0
+        super().__init__(latency=latency, responder=responder or scripted_response, token_latency=token_latency, **kwargs)
+        self._tool_script = tool_script or scripted_tool_calls
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScriptedLLM"
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], tools: Optional[Sequence[Any]] = None, **kwargs: Any) -> ChatResponse:
+        tool_calls = self._tool_script(messages, tools) if tools else []
+        if not tool_calls:
+            return await super().achat(messages)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._calls += 1
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content="", additional_kwargs={"tool_calls": tool_calls}))
+
+    def get_tool_calls_from_response(self, response: ChatResponse, error_on_no_tool_call: bool = True, **kwargs: Any) -> list:
+        tool_calls = response.message.additional_kwargs.get("tool_calls", [])
+        if not tool_calls and error_on_no_tool_call:
+            raise ValueError("No tool calls in the response")
+        return tool_calls
+
+# LLM services built from API clients; use_fake_llm() replaces them all
+llm_services = [
+    "app.llm", "app_1.llm", "wf_agents.llm", "customer_db.llm",
+    "pending_tx_agent.llm", "retriever.llm", "sub_question_query_engine.llm",
+]
+
+def use_fake_llm(
+    latency: float = 0.05,
+    responder: Optional[Callable[[str], str]] = None,
+    token_latency: float = 0.0,
+    llm: Optional[FakeLLM] = None,
+) -> FakeLLM:
+    """Serve every LLM service with `llm` (by default a new FakeLLM), e.g. to load-test the app without API keys."""
+    from services import services
+
+    llm = llm or FakeLLM(latency=latency, responder=responder, token_latency=token_latency)
+    for name in llm_services:
+        services.set(name, llm)
+    return llm
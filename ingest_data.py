@@ -1,9 +1,14 @@
 import os
+import hashlib
 from dotenv import load_dotenv
 from llama_index.embeddings.gemini import GeminiEmbedding
+from embedding_cache import CachedBatchEmbedding
+from numpy_vector_store import NumpyVectorStore
 from llama_parse import LlamaParse
-from llama_index.core import VectorStoreIndex
+from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
+from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.schema import TextNode
+from pathlib import Path
 from typing import List
 import json
 
@@ -13,11 +18,26 @@ file_paths = ["docs/interest-rates_1.pdf", "docs/interest-rates_2.pdf", "docs/in
 
 persist_dir = "./vector_index"
 
+manifest_file = "ingest_manifest.json"
+
+# build an IVF index next to the vectors so retriever.py can use ann_index_type = "ivf"
+build_ann = False
+# number of IVF lists, None picks sqrt(number of vectors)
+ann_nlist = None
+
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 model_name = "models/text-embedding-004"
 
-embed_model = GeminiEmbedding(model_name=model_name, api_key=GOOGLE_API_KEY)
+# texts per embedding request and number of requests in flight
+embed_batch_size = 100
+embed_max_concurrency = 4
+
+embed_model = CachedBatchEmbedding(
+    GeminiEmbedding(model_name=model_name, api_key=GOOGLE_API_KEY),
+    batch_size=embed_batch_size,
+    max_concurrency=embed_max_concurrency,
+)
 
 system_prompt = """
 You are given bank interest rates in text and tables format for a UK bank.
@@ -31,22 +51,162 @@ parser = LlamaParse(
     invalidate_cache=True,
     system_prompt=system_prompt,
 )
-    
+
+splitter = SentenceSplitter()
+
+def file_fingerprint(file_path: str) -> str:
+    """Return the sha256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_fingerprint(text: str) -> str:
+    """Return the sha256 of a parsed chunk's text, used as its node id."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_manifest(persist_dir: str) -> dict:
+    """
+    Load the ingestion manifest stored next to the index.
+
+    files:  source path -> content hash
+    contents: content hash -> chunk hashes produced by parsing that content
+    chunks: chunk hash -> content hashes referencing it (the node is deleted when empty)
+    """
+    path = Path(persist_dir) / manifest_file
+    if not path.exists():
+        return {"files": {}, "contents": {}, "chunks": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict, persist_dir: str):
+    path = Path(persist_dir) / manifest_file
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def load_or_create_index(persist_dir: str):
+    """Load the persisted index if there is one, otherwise start an empty one."""
+    if (Path(persist_dir) / "index_store.json").exists():
+        storage_context = StorageContext.from_defaults(
+            persist_dir=persist_dir,
+            vector_store=NumpyVectorStore.from_persist_dir(persist_dir, use_ann=build_ann),
+        )
+        return load_index_from_storage(storage_context, embed_model=embed_model)
+    return create_empty_index()
+
+def create_empty_index():
+    storage_context = StorageContext.from_defaults(vector_store=NumpyVectorStore())
+    return VectorStoreIndex(nodes=[], storage_context=storage_context, embed_model=embed_model)
+
+def parse_to_nodes(file_path: str, content_hash: str) -> List[TextNode]:
+    """Parse a file and split it into nodes whose ids are their chunk hashes."""
+    documents = parser.load_data(file_path)
+    for document in documents:
+        document.id_ = content_hash
+        document.metadata["file_path"] = file_path
+    nodes = splitter.get_nodes_from_documents(documents)
+    for node in nodes:
+        node.id_ = chunk_fingerprint(node.get_content())
+    return nodes
+
+def release_content(index, manifest: dict, content_hash: str):
+    """Drop one content's references to its chunks and delete chunks nobody references."""
+    orphaned = []
+    for chunk_hash in manifest["contents"].pop(content_hash, []):
+        refs = manifest["chunks"].get(chunk_hash, [])
+        if content_hash in refs:
+            refs.remove(content_hash)
+        if not refs:
+            manifest["chunks"].pop(chunk_hash, None)
+            orphaned.append(chunk_hash)
+
+    if orphaned:
+        index.delete_nodes(orphaned, delete_from_docstore=True)
+        for node_id in orphaned:
+            index.index_struct.delete(node_id)
+        index.storage_context.index_store.add_index_struct(index.index_struct)
+    return len(orphaned)
+
 def ingest_pdf(file_paths: List[str], persist_dir: str):
     """
-    Ingest a PDF file and push it to the vector index
+    Incrementally ingest PDF files into the vector index
+
+    Files whose bytes did not change since the last run are skipped, byte-identical
+    files are parsed once, chunks already in the index are not embedded again and
+    the nodes of files that are no longer listed are deleted.
     """
     print("pushing the document to the vector index")
 
-    documents = parser.load_data(file_paths)
+    manifest = load_manifest(persist_dir)
+    if (Path(persist_dir) / manifest_file).exists():
+        index = load_or_create_index(persist_dir)
+    else:
+        # an index written before manifests existed can't be diffed, rebuild it
+        index = create_empty_index()
+
+    current_files = {path: file_fingerprint(path) for path in file_paths}
+    previous_files = manifest["files"]
+
+    # contents nobody points to any more (file removed or its bytes changed)
+    live_contents = set(current_files.values())
+    deleted = 0
+    for content_hash in list(manifest["contents"]):
+        if content_hash not in live_contents:
+            deleted += release_content(index, manifest, content_hash)
+
+    # parse every new content once, even if several files share it
+    new_contents = {}
+    for path, content_hash in current_files.items():
+        if content_hash not in manifest["contents"] and content_hash not in new_contents:
+            new_contents[content_hash] = path
+
+    new_nodes = []
+    skipped_chunks = 0
+    for content_hash, path in new_contents.items():
+        print(f"parsing {path}")
+        chunk_hashes = []
+        seen = set()
+        for node in parse_to_nodes(path, content_hash):
+            chunk_hash = node.id_
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            chunk_hashes.append(chunk_hash)
+            refs = manifest["chunks"].setdefault(chunk_hash, [])
+            if not refs:
+                new_nodes.append(node)
+            else:
+                skipped_chunks += 1
+            refs.append(content_hash)
+        manifest["contents"][content_hash] = chunk_hashes
+
+    if new_nodes:
+        index.insert_nodes(new_nodes)
+
+    manifest["files"] = current_files
+    unchanged = sum(1 for path, h in current_files.items() if previous_files.get(path) == h)
+    print(
+        f"files: {len(current_files)} ({unchanged} unchanged, {len(new_contents)} parsed), "
+        f"nodes: {len(new_nodes)} embedded, {skipped_chunks} duplicate chunks skipped, {deleted} deleted"
+    )
+    print(f"embeddings: {embed_model.stats.summary()}")
 
-    index = VectorStoreIndex.from_documents(documents, embed_model=embed_model)
     index.storage_context.persist(persist_dir=persist_dir)
+    # persist() drops the IVF index whenever it rewrites the vectors
+    vector_store = index.vector_store
+    if build_ann and not vector_store.has_ann_index() and vector_store.num_vectors:
+        print("building the IVF index")
+        vector_store.build_ann_index(nlist=ann_nlist)
+        vector_store.save_ann_index(persist_dir)
+    save_manifest(manifest, persist_dir)
     return index
 
-# Ingest the PDF files into the vector index
-# index = ingest_pdf(file_paths, persist_dir)
-# question = "Whats the Cash ISA Saver's annual interest rate for an account opened after 18/02/25?"
-# response = index.as_query_engine().query(question)
-# print(response)
-
+if __name__ == "__main__":
+    # Ingest the PDF files into the vector index
+    index = ingest_pdf(file_paths, persist_dir)
+    # question = "Whats the Cash ISA Saver's annual interest rate for an account opened after 18/02/25?"
+    # response = index.as_query_engine().query(question)
+    # print(response)
@@ -0,0 +1,103 @@
+from typing import Any, List, Sequence
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import ChatMessage, LLMMetadata
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+
+from services import services
+
+class LazyLLM(FunctionCallingLLM):
+    """
+    Stands in for the LLM registered in services as `service_name`, which is built
+    on the first call rather than when agents and tools are defined at import
+    (and again in each forked worker when the service is per-process).
+    """
+
+    _service_name: str = PrivateAttr()
+
+    def __init__(self, service_name: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._service_name = service_name
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LazyLLM"
+
+    @property
+    def llm(self):
+        return services.get(self._service_name)
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self.llm.metadata
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self.llm.chat(messages, **kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self.llm.complete(prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return self.llm.stream_chat(messages, **kwargs)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return self.llm.stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return await self.llm.achat(messages, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await self.llm.acomplete(prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        return await self.llm.astream_chat(messages, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return await self.llm.astream_complete(prompt, formatted=formatted, **kwargs)
+
+    def _prepare_chat_with_tools(self, *args: Any, **kwargs: Any):
+        return self.llm._prepare_chat_with_tools(*args, **kwargs)
+
+    def _validate_chat_with_tools_response(self, *args: Any, **kwargs: Any):
+        return self.llm._validate_chat_with_tools_response(*args, **kwargs)
+
+    def get_tool_calls_from_response(self, *args: Any, **kwargs: Any):
+        return self.llm.get_tool_calls_from_response(*args, **kwargs)
+
+class LazyEmbedding(BaseEmbedding):
+    """Stands in for the embedding model registered in services as `service_name`, like LazyLLM."""
+
+    _service_name: str = PrivateAttr()
+
+    def __init__(self, service_name: str, **kwargs: Any):
+        # batching is left to the real model
+        kwargs.setdefault("embed_batch_size", 2048)
+        super().__init__(**kwargs)
+        self._service_name = service_name
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LazyEmbedding"
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return services.get(self._service_name)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self.embed_model.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.embed_model.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await self.embed_model.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_model.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self.embed_model.aget_text_embedding_batch(texts)
@@ -0,0 +1,351 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, List, Optional
+
+import numpy as np
+from ann_index import IVFIndex
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+vectors_fname = "vectors.npy"
+ids_fname = "vector_ids.json"
+ann_fname = "ivf.npz"
+
+# rows copied per step when compacting the matrix on persist
+copy_chunk_rows = 65536
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    Vector store keeping L2-normalised float32 embeddings in a single .npy matrix.
+
+    A persisted matrix is opened with np.memmap, so loading only maps the file and
+    memory grows with the pages a query actually touches. Node ids and ref doc ids
+    live in a small JSON sidecar. Top-k is one matrix-vector product followed by
+    np.argpartition. Nodes added after loading are kept in an in-memory tail and
+    deleted rows are masked out until the next persist compacts the matrix.
+
+    With an IVFIndex attached (see build_ann_index), queries scan only the closest
+    inverted lists of the persisted matrix instead of every row.
+    """
+
+    stores_text: bool = False
+
+    _matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _tail: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _tail_matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[str] = PrivateAttr(default_factory=list)
+    _row_by_id: dict = PrivateAttr(default_factory=dict)
+    _deleted: set = PrivateAttr(default_factory=set)
+    _ann: Optional[IVFIndex] = PrivateAttr(default=None)
+    _persisted_path: Optional[str] = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @classmethod
+    def from_persist_dir(
+        cls,
+        persist_dir: str,
+        namespace: str = "default",
+        use_ann: bool = False,
+        nprobe: Optional[int] = None,
+    ) -> "NumpyVectorStore":
+        """
+        Open a persisted store, converting a SimpleVectorStore JSON file if that is all there is.
+
+        With use_ann the persisted IVF index is loaded too (if there is one) and
+        nprobe overrides the number of lists it scans per query.
+        """
+        store = cls()
+        vectors_path = Path(persist_dir) / f"{namespace}__{vectors_fname}"
+        ids_path = Path(persist_dir) / f"{namespace}__{ids_fname}"
+
+        if vectors_path.exists():
+            with open(ids_path) as f:
+                sidecar = json.load(f)
+            matrix = np.load(vectors_path, mmap_mode="r")
+            if matrix.shape[0] != len(sidecar["ids"]):
+                raise ValueError(f"{vectors_path} and {ids_path} are out of sync.")
+            store._matrix = matrix
+            store._ids = sidecar["ids"]
+            store._ref_doc_ids = [sidecar["ref_docs"][i] for i in sidecar["ref_doc_index"]]
+            store._row_by_id = {node_id: row for row, node_id in enumerate(store._ids)}
+            store._persisted_path = str(vectors_path)
+
+            ann_path = Path(persist_dir) / f"{namespace}__{ann_fname}"
+            if use_ann and ann_path.exists():
+                ann = IVFIndex.load(str(ann_path))
+                if ann.num_rows == matrix.shape[0]:
+                    if nprobe:
+                        ann.nprobe = nprobe
+                    store._ann = ann
+            return store
+
+        legacy_path = Path(persist_dir) / f"{namespace}__vector_store.json"
+        if legacy_path.exists():
+            with open(legacy_path) as f:
+                data = json.load(f)
+            embedding_dict = data.get("embedding_dict", {})
+            ref_docs = data.get("text_id_to_ref_doc_id", {})
+            if embedding_dict:
+                store._append(
+                    list(embedding_dict),
+                    [ref_docs.get(node_id, "") for node_id in embedding_dict],
+                    np.asarray(list(embedding_dict.values()), dtype=np.float32),
+                )
+        return store
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def num_vectors(self) -> int:
+        # not __len__: StorageContext checks `if vector_store:` and an empty store would be falsy
+        return len(self._ids) - len(self._deleted)
+
+    def _append(self, ids: List[str], ref_doc_ids: List[str], vectors: np.ndarray):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = (vectors / norms).astype(np.float32)
+        for node_id in ids:
+            # re-adding a node replaces its previous vector
+            if node_id in self._row_by_id:
+                self._deleted.add(self._row_by_id[node_id])
+            self._row_by_id[node_id] = len(self._ids)
+            self._ids.append(node_id)
+        self._ref_doc_ids.extend(ref_doc_ids)
+        self._tail.append(vectors)
+        self._tail_matrix = None
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        parts = []
+        if self._matrix is not None and self._matrix.shape[0]:
+            parts.append(self._matrix @ query)
+        if self._tail:
+            if self._tail_matrix is None:
+                self._tail_matrix = np.vstack(self._tail)
+            parts.append(self._tail_matrix @ query)
+        if not parts:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        ids = [node.node_id for node in nodes]
+        ref_doc_ids = [node.ref_doc_id or "" for node in nodes]
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        self._append(ids, ref_doc_ids, vectors)
+        return ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        for row, row_ref_doc_id in enumerate(self._ref_doc_ids):
+            if row_ref_doc_id == ref_doc_id and row not in self._deleted:
+                self._deleted.add(row)
+                self._row_by_id.pop(self._ids[row], None)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[Any] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        if filters is not None:
+            raise ValueError("NumpyVectorStore does not support metadata filters.")
+        for node_id in node_ids or []:
+            row = self._row_by_id.pop(node_id, None)
+            if row is not None:
+                self._deleted.add(row)
+
+    def clear(self) -> None:
+        self._matrix = None
+        self._tail = []
+        self._tail_matrix = None
+        self._ids = []
+        self._ref_doc_ids = []
+        self._row_by_id = {}
+        self._deleted = set()
+        self._ann = None
+        self._persisted_path = None
+
+    def _candidate_mask(self, query: VectorStoreQuery) -> Optional[np.ndarray]:
+        """Boolean mask of rows a query may return, or None when every row is allowed."""
+        if not self._deleted and not query.doc_ids and not query.node_ids:
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        if self._deleted:
+            mask[list(self._deleted)] = False
+        if query.doc_ids:
+            doc_ids = set(query.doc_ids)
+            mask &= np.fromiter((r in doc_ids for r in self._ref_doc_ids), dtype=bool, count=len(self._ids))
+        if query.node_ids:
+            node_ids = set(query.node_ids)
+            mask &= np.fromiter((n in node_ids for n in self._ids), dtype=bool, count=len(self._ids))
+        return mask
+
+    def build_ann_index(self, nlist: Optional[int] = None, nprobe: int = 8) -> IVFIndex:
+        """Cluster the persisted matrix into an IVF index. Call after persist()."""
+        if self._tail or self._deleted:
+            raise ValueError("Persist the store before building the ANN index.")
+        if self._matrix is None or not self._matrix.shape[0]:
+            raise ValueError("Cannot build an ANN index over an empty store.")
+        self._ann = IVFIndex.build(self._matrix, nlist=nlist, nprobe=nprobe)
+        return self._ann
+
+    def has_ann_index(self) -> bool:
+        return self._ann is not None
+
+    def save_ann_index(self, persist_dir: str, namespace: str = "default"):
+        if self._ann is not None:
+            self._ann.save(os.path.join(persist_dir, f"{namespace}__{ann_fname}"))
+
+    def _ann_query(self, query_vector: np.ndarray, k: int, nprobe: Optional[int]):
+        """Approximate top-k over the persisted matrix, exact over the in-memory tail."""
+        base_rows = self._matrix.shape[0]
+        excluded = np.fromiter((r for r in self._deleted if r < base_rows), dtype=np.int64)
+        rows, scores = self._ann.search(self._matrix, query_vector, k, nprobe=nprobe, excluded_rows=excluded)
+
+        if self._tail:
+            if self._tail_matrix is None:
+                self._tail_matrix = np.vstack(self._tail)
+            tail_scores = self._tail_matrix @ query_vector
+            for row in self._deleted:
+                if row >= base_rows:
+                    tail_scores[row - base_rows] = -np.inf
+            tail_rows = self._top_k(tail_scores, k)
+            tail_rows = tail_rows[np.isfinite(tail_scores[tail_rows])]
+            rows = np.concatenate([rows, tail_rows + base_rows])
+            scores = np.concatenate([scores, tail_scores[tail_rows]])
+            best = np.argsort(-scores)[:k]
+            rows, scores = rows[best], scores[best]
+        return rows, scores
+
+    def _top_k(self, scores: np.ndarray, k: int):
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("NumpyVectorStore does not support metadata filters.")
+
+        query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+
+        if self._ann is not None and not query.doc_ids and not query.node_ids:
+            rows, scores = self._ann_query(query_vector, query.similarity_top_k, kwargs.get("nprobe"))
+            return VectorStoreQueryResult(
+                similarities=[float(score) for score in scores],
+                ids=[self._ids[row] for row in rows],
+            )
+
+        scores = self._scores(query_vector)
+        mask = self._candidate_mask(query)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            k = min(query.similarity_top_k, int(mask.sum()))
+        else:
+            k = query.similarity_top_k
+
+        rows = self._top_k(scores, k)
+        return VectorStoreQueryResult(
+            similarities=[float(scores[row]) for row in rows],
+            ids=[self._ids[row] for row in rows],
+        )
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        """
+        Write the live rows to <namespace>__vectors.npy and the ids to the sidecar.
+
+        persist_path is the "<namespace>__vector_store.json" path StorageContext
+        passes to every vector store; only its directory and namespace are used.
+        """
+        persist_dir = os.path.dirname(persist_path)
+        namespace = os.path.basename(persist_path).split("__")[0]
+        os.makedirs(persist_dir, exist_ok=True)
+        vectors_path = os.path.join(persist_dir, f"{namespace}__{vectors_fname}")
+        ids_path = os.path.join(persist_dir, f"{namespace}__{ids_fname}")
+        ann_path = os.path.join(persist_dir, f"{namespace}__{ann_fname}")
+
+        # nothing changed since the files were written: leave them (and their mtimes) alone
+        if (
+            not self._tail
+            and not self._deleted
+            and self._persisted_path is not None
+            and os.path.abspath(self._persisted_path) == os.path.abspath(vectors_path)
+        ):
+            return
+
+        live_rows = [row for row in range(len(self._ids)) if row not in self._deleted]
+        dim = self._dim()
+
+        tmp_vectors_path = vectors_path + ".tmp.npy"
+        out = np.lib.format.open_memmap(
+            tmp_vectors_path, mode="w+", dtype=np.float32, shape=(len(live_rows), dim)
+        )
+        base_rows = self._matrix.shape[0] if self._matrix is not None else 0
+        tail = np.vstack(self._tail) if self._tail else None
+        for start in range(0, len(live_rows), copy_chunk_rows):
+            chunk = np.asarray(live_rows[start:start + copy_chunk_rows])
+            from_base = chunk[chunk < base_rows]
+            from_tail = chunk[chunk >= base_rows] - base_rows
+            block = []
+            if len(from_base):
+                block.append(self._matrix[from_base])
+            if len(from_tail):
+                block.append(tail[from_tail])
+            out[start:start + len(chunk)] = np.vstack(block)
+        out.flush()
+        del out
+
+        ids = [self._ids[row] for row in live_rows]
+        ref_doc_ids = [self._ref_doc_ids[row] for row in live_rows]
+        ref_docs = sorted(set(ref_doc_ids))
+        ref_doc_position = {ref_doc_id: i for i, ref_doc_id in enumerate(ref_docs)}
+        tmp_ids_path = ids_path + ".tmp"
+        with open(tmp_ids_path, "w") as f:
+            json.dump(
+                {
+                    "ids": ids,
+                    "ref_docs": ref_docs,
+                    "ref_doc_index": [ref_doc_position[r] for r in ref_doc_ids],
+                },
+                f,
+            )
+
+        os.replace(tmp_vectors_path, vectors_path)
+        os.replace(tmp_ids_path, ids_path)
+        # rows were renumbered, so an existing IVF index no longer matches
+        if os.path.exists(ann_path):
+            os.remove(ann_path)
+        self._ann = None
+
+        # keep serving from the compacted file
+        self._matrix = np.load(vectors_path, mmap_mode="r")
+        self._tail = []
+        self._tail_matrix = None
+        self._ids = ids
+        self._ref_doc_ids = ref_doc_ids
+        self._row_by_id = {node_id: row for row, node_id in enumerate(ids)}
+        self._deleted = set()
+        self._persisted_path = vectors_path
+
+    def _dim(self) -> int:
+        if self._matrix is not None and self._matrix.shape[0]:
+            return self._matrix.shape[1]
+        if self._tail:
+            return self._tail[0].shape[1]
+        return 0
@@ -1,25 +1,720 @@
 from dotenv import load_dotenv
 import os
+import re
+import io
+import csv
+import json
+import hashlib
+import threading
+import uuid
+import weakref
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+import numpy as np
 import pandas as pd
-from llama_index.experimental.query_engine import PandasQueryEngine
-from llama_index.llms.gemini import Gemini
+from pandas.api.types import union_categoricals
+from llama_index.core.tools import FunctionTool
+from async_tools import run_sync
+from services import lazy_attributes, services
+from lazy_llm import LazyLLM
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-llm = Gemini(model="models/gemini-2.0-pro-exp-02-05",api_key=GOOGLE_API_KEY)
+pending_tx_path = "docs/pending_tx.csv"
 
-df = pd.read_csv("docs/pending_tx.csv")
+# .npy column cache for fast cold starts, kept next to the CSV ({csv} is its path);
+# None to always parse the CSV
+pending_tx_cache_dir = "{csv}.cache"
+
+# seconds between checks of the CSV for appended rows (tail mode), None to never tail
+pending_tx_poll_seconds = 1.0
+
+# rows parsed per CSV chunk
+pending_tx_chunksize = 1_000_000
+
+# transactions kept per customer for "latest transactions" answers
+latest_tx_count = 5
+
+@dataclass
+class PendingTx:
+    pending_tx_id: str
+    pending_date: str
+    amount_cents: int
+
+@dataclass
+class PendingTxSummary:
+    customer_id: str
+    total_cents: int
+    count: int
+    first_date: str
+    last_date: str
+    latest: List[PendingTx] = field(default_factory=list)
+
+    @property
+    def total_amount(self) -> float:
+        return self.total_cents / 100
+
+def to_compact_frame(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert raw CSV rows to the compact in-memory layout: categorical customer_id,
+    datetime64 pending_date and int64 amount_cents in place of float pending_amount.
+    """
+    return pd.DataFrame({
+        "pending_tx_id": chunk["pending_tx_id"].astype("string"),
+        "customer_id": chunk["customer_id"].astype("category"),
+        "pending_date": pd.to_datetime(chunk["pending_date"]).astype("datetime64[ns]"),
+        "amount_cents": (pd.to_numeric(chunk["pending_amount"]) * 100).round().astype("int64"),
+    })
+
+def read_pending_tx_chunks(source, chunksize: int = pending_tx_chunksize, compact: bool = True):
+    """Stream the pending transactions CSV (a path or binary file) as DataFrame chunks."""
+    reader = pd.read_csv(
+        source,
+        chunksize=chunksize,
+        dtype={"pending_tx_id": "string", "customer_id": "string", "pending_amount": "float64"},
+    )
+    for chunk in reader:
+        yield to_compact_frame(chunk) if compact else chunk
+
+def concat_compact_frames(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate chunks keeping customer_id categorical across differing categories."""
+    if not chunks:
+        return to_compact_frame(pd.DataFrame(columns=["pending_tx_id", "customer_id", "pending_date", "pending_amount"]))
+    customer_ids = union_categoricals([chunk["customer_id"] for chunk in chunks])
+    frame = pd.concat([chunk.drop(columns="customer_id") for chunk in chunks], ignore_index=True)
+    frame.insert(1, "customer_id", pd.Categorical(customer_ids))
+    return frame
+
+def _count_lines(path: str, end: int) -> int:
+    """Lines in the first `end` bytes of a file, counting a last line without a newline."""
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        remaining = end
+        while remaining > 0:
+            block = f.read(min(remaining, 1 << 20))
+            if not block:
+                break
+            lines += block.count(b"\n")
+            last = block[-1:]
+            remaining -= len(block)
+    return lines + (last != b"\n")
+
+def read_compact_frame(path: str, end: int, chunksize: int = pending_tx_chunksize):
+    """
+    Stream the first `end` bytes of the CSV into one compact frame.
+
+    The columns are preallocated from the line count and filled chunk by chunk, so
+    memory peaks at the compact frame plus one raw chunk, not at every chunk plus
+    their concatenation. Returns (frame, pending_tx_ids of removal rows).
+    """
+    capacity = _count_lines(path, end)
+    ids = np.empty(capacity, dtype=object)
+    codes = np.empty(capacity, dtype=np.int32)
+    dates = np.empty(capacity, dtype="datetime64[ns]")
+    cents = np.empty(capacity, dtype=np.int64)
+    categories = {}
+    removed = []
+    rows = 0
+    with open(path, "rb") as f:
+        for chunk in read_pending_tx_chunks(_LimitedReader(f, end), chunksize, compact=False):
+            added, chunk_removed = split_removals(chunk)
+            removed.extend(chunk_removed)
+            compact = to_compact_frame(added)
+            size = len(compact)
+            # chunk codes -> codes over every customer seen so far; a missing id (-1) stays -1
+            mapping = np.array(
+                [categories.setdefault(c, len(categories)) for c in compact["customer_id"].cat.categories] + [-1],
+                dtype=np.int32,
+            )
+            codes[rows:rows + size] = mapping[compact["customer_id"].cat.codes.to_numpy()]
+            ids[rows:rows + size] = compact["pending_tx_id"].to_numpy(dtype=object)
+            dates[rows:rows + size] = compact["pending_date"].to_numpy(dtype="datetime64[ns]")
+            cents[rows:rows + size] = compact["amount_cents"].to_numpy()
+            rows += size
+    frame = pd.DataFrame({
+        "pending_tx_id": pd.array(ids[:rows], dtype="string"),
+        "customer_id": pd.Categorical.from_codes(codes[:rows], categories=pd.Index(list(categories), dtype="string")),
+        "pending_date": dates[:rows],
+        "amount_cents": cents[:rows],
+    }, copy=False)
+    return frame, removed
+
+class PendingTxIndex:
+    """
+    Per-customer aggregates of the pending transactions (sum, count, date range and
+    the latest transactions) so lookups are a dict access. Built incrementally from
+    compact chunks; amounts are kept in integer pence so totals don't accumulate
+    float error.
+    """
+
+    def __init__(self, latest_n: int = latest_tx_count):
+        self.latest_n = latest_n
+        self._summaries = {}
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, latest_n: int = latest_tx_count) -> "PendingTxIndex":
+        index = cls(latest_n)
+        index.update(frame)
+        return index
+
+    def update(self, chunk: pd.DataFrame):
+        """Fold a compact chunk of transactions into the aggregates."""
+        if chunk.empty:
+            return
+        grouped = chunk.groupby("customer_id", observed=True).agg(
+            total_cents=("amount_cents", "sum"),
+            count=("amount_cents", "size"),
+            first_date=("pending_date", "min"),
+            last_date=("pending_date", "max"),
+        )
+        # newest first; on equal dates the row appended last comes first
+        latest_rows = (
+            chunk.iloc[::-1]
+            .sort_values("pending_date", ascending=False, kind="stable")
+            .groupby("customer_id", observed=True)
+            .head(self.latest_n)
+        )
+        latest_by_customer = {}
+        for row in latest_rows.itertuples(index=False):
+            latest_by_customer.setdefault(str(row.customer_id), []).append(
+                PendingTx(str(row.pending_tx_id), row.pending_date.strftime("%Y-%m-%d"), int(row.amount_cents))
+            )
+
+        for row in grouped.itertuples():
+            customer_id = str(row.Index)
+            first_date = row.first_date.strftime("%Y-%m-%d")
+            last_date = row.last_date.strftime("%Y-%m-%d")
+            previous = self._summaries.get(customer_id)
+            if previous is None:
+                previous = PendingTxSummary(customer_id, 0, 0, first_date, last_date)
+            merged = latest_by_customer[customer_id] + previous.latest
+            merged.sort(key=lambda tx: tx.pending_date, reverse=True)
+            # replaced, never mutated: callers may still hold the previous summary
+            self._summaries[customer_id] = PendingTxSummary(
+                customer_id=customer_id,
+                total_cents=previous.total_cents + int(row.total_cents),
+                count=previous.count + int(row.count),
+                first_date=min(previous.first_date, first_date),
+                last_date=max(previous.last_date, last_date),
+                latest=merged[:self.latest_n],
+            )
+
+    def drop(self, customer_ids: Iterable[str]):
+        for customer_id in customer_ids:
+            self._summaries.pop(customer_id, None)
+
+    def summary(self, customer_id: str) -> Optional[PendingTxSummary]:
+        return self._summaries.get(customer_id.upper())
+
+# rows with one of these statuses settle/remove a pending transaction instead of adding it
+removed_statuses = {"settled", "removed", "cancelled"}
+
+# appended batches kept as separate frames before they are merged into one
+max_frame_parts = 32
+
+class _LimitedReader(io.RawIOBase):
+    """Read at most `limit` bytes of a binary file, so a concurrent writer can't leak half a row in."""
+
+    def __init__(self, f, limit: int):
+        self._f = f
+        self._remaining = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._f.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+def complete_lines_end(path: str, size: int) -> int:
+    """Offset just past the last newline at or before `size`."""
+    with open(path, "rb") as f:
+        position = size
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                return start + newline + 1
+            position = start
+    return 0
+
+def read_csv_header(path: str) -> List[str]:
+    with open(path, "r", newline="") as f:
+        return next(csv.reader(f), [])
+
+def split_removals(chunk: pd.DataFrame):
+    """Split raw rows into (rows to add, pending_tx_ids to remove) using the optional status column."""
+    if "status" not in chunk.columns:
+        return chunk, []
+    removed = chunk["status"].astype("string").str.lower().isin(removed_statuses).fillna(False)
+    return chunk[~removed], chunk.loc[removed, "pending_tx_id"].astype(str).tolist()
+
+def _prefix_signature(path: str, offset: int) -> dict:
+    """Identify the first `offset` bytes of a file by hashing its first and last 64KB."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read(min(offset, 65536)))
+        f.seek(max(0, offset - 65536))
+        digest.update(f.read(min(offset, 65536)))
+    return {"path": os.path.abspath(path), "offset": offset, "hash": digest.hexdigest()}
+
+def save_pending_tx_columns(frame: pd.DataFrame, cache_dir: str, source: dict):
+    """
+    Persist a compact frame as one .npy file per column plus a JSON sidecar.
+
+    The columns go to new files and meta.json, replaced last, points at them: a
+    crash or a concurrent writer never leaves a cache that loads torn. Ids are
+    stored as fixed-width UTF-8 bytes.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, "meta.json")
+    previous = _read_cache_meta(meta_path)
+    token = uuid.uuid4().hex[:12]
+    columns = {
+        "pending_tx_id": np.array([i.encode("utf-8") for i in frame["pending_tx_id"].fillna("")], dtype="S"),
+        "customer_code": frame["customer_id"].cat.codes.to_numpy(),
+        "pending_date": frame["pending_date"].to_numpy(dtype="datetime64[ns]"),
+        "amount_cents": frame["amount_cents"].to_numpy(),
+    }
+    files = {}
+    for name, values in columns.items():
+        files[name] = f"{name}.{token}.npy"
+        np.save(os.path.join(cache_dir, files[name]), values)
+    meta = {
+        "source": source,
+        "rows": len(frame),
+        "files": files,
+        "customers": [str(c) for c in frame["customer_id"].cat.categories],
+    }
+    with open(meta_path + f".{token}.tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + f".{token}.tmp", meta_path)
+    for name in (previous or {}).get("files", {}).values():
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            pass
+
+def _read_cache_meta(meta_path: str) -> Optional[dict]:
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def load_pending_tx_columns(cache_dir: str, path: str):
+    """
+    Load the column cache if the CSV still starts with the bytes it was built from.
+
+    Returns (frame, offset) or (None, 0). Rows appended after `offset` still have
+    to be read from the CSV. A cache whose files are missing or don't match its
+    sidecar (e.g. replaced by another writer meanwhile) counts as missing.
+    """
+    meta = _read_cache_meta(os.path.join(cache_dir, "meta.json"))
+    if meta is None or "files" not in meta:
+        return None, 0
+    offset = meta["source"].get("offset", -1)
+    if offset < 0 or os.path.getsize(path) < offset or _prefix_signature(path, offset) != meta["source"]:
+        return None, 0
+    try:
+        columns = {name: np.load(os.path.join(cache_dir, file)) for name, file in meta["files"].items()}
+    except (OSError, ValueError):
+        return None, 0
+    if any(len(values) != meta["rows"] for values in columns.values()):
+        return None, 0
+    frame = pd.DataFrame({
+        "pending_tx_id": pd.array([i.decode("utf-8") for i in columns["pending_tx_id"].tolist()], dtype="string"),
+        "customer_id": pd.Categorical.from_codes(
+            columns["customer_code"],
+            categories=pd.Index(meta["customers"], dtype="string"),
+        ),
+        "pending_date": columns["pending_date"],
+        "amount_cents": columns["amount_cents"],
+    })
+    return frame, offset
+
+class PendingTxStore:
+    """
+    The pending transactions (as compact frame parts) plus their aggregate index.
+
+    Batches of added and removed transactions are applied under a lock, and readers
+    take the same lock, so nobody observes a half-applied batch. Summaries are
+    replaced rather than mutated, so a summary a caller already holds never changes.
+    In tail mode poll() reads only the bytes appended to the CSV since the last read;
+    start_watching() polls on a background thread.
+    """
+
+    def __init__(self, frame: pd.DataFrame, path: Optional[str] = None, offset: int = 0, chunksize: int = pending_tx_chunksize):
+        self.path = path
+        self.offset = offset
+        self.chunksize = chunksize
+        self.version = 0
+        self._lock = threading.RLock()
+        # held from reading the offset to storing the new one, so no rows are applied twice
+        self._poll_lock = threading.RLock()
+        self._parts = [frame] if len(frame) else []
+        self._index = PendingTxIndex.from_frame(frame)
+        self._frame_cache = None
+        self._columns = read_csv_header(path) if path else None
+        self._watcher = None
+
+    @classmethod
+    def load(
+        cls,
+        path: str = pending_tx_path,
+        chunksize: int = pending_tx_chunksize,
+        cache_dir: Optional[str] = pending_tx_cache_dir,
+    ) -> "PendingTxStore":
+        """
+        Load the CSV, from the column cache when it is still a prefix of the file.
+
+        The CSV is streamed in chunks; rows appended after the cached or read
+        offset are applied like a tail batch. With a cache_dir ({csv} stands for
+        the CSV's path) the compact columns are saved after a full parse.
+        """
+        offset = 0
+        frame = None
+        if cache_dir:
+            cache_dir = cache_dir.format(csv=path)
+            frame, offset = load_pending_tx_columns(cache_dir, path)
+
+        if frame is None:
+            # the last row may lack a newline (as in the shipped CSV): appenders start with one
+            end = os.path.getsize(path)
+            frame, removed = read_compact_frame(path, end, chunksize)
+            if removed:
+                frame = frame[~frame["pending_tx_id"].isin(removed)].reset_index(drop=True)
+            offset = end
+            if cache_dir:
+                save_pending_tx_columns(frame, cache_dir, _prefix_signature(path, offset))
+
+        store = cls(frame, path=path, offset=offset, chunksize=chunksize)
+        store.poll()
+        return store
+
+    def summary(self, customer_id: str) -> Optional[PendingTxSummary]:
+        with self._lock:
+            return self._index.summary(customer_id)
+
+    def frame(self) -> pd.DataFrame:
+        """The live transactions as one compact frame (cached until the next batch)."""
+        with self._lock:
+            if self._frame_cache is None or self._frame_cache[0] != self.version:
+                self._frame_cache = (self.version, concat_compact_frames(self._parts))
+            return self._frame_cache[1]
+
+    def apply_batch(self, added: Optional[pd.DataFrame] = None, removed: Iterable[str] = ()):
+        """
+        Apply appended transactions and settled/removed pending_tx_ids atomically.
+
+        `added` holds raw rows (pending_tx_id, customer_id, pending_date,
+        pending_amount) as in the CSV. Additions are applied before removals, so a
+        transaction added and settled in the same batch ends up removed.
+        """
+        removed = set(removed)
+        added_frame = to_compact_frame(added) if added is not None and len(added) else None
+        if added_frame is None and not removed:
+            return
+
+        with self._lock:
+            if added_frame is not None:
+                self._parts.append(added_frame)
+                self._index.update(added_frame)
+
+            if removed:
+                affected = set()
+                parts = []
+                for part in self._parts:
+                    mask = part["pending_tx_id"].isin(removed)
+                    if mask.any():
+                        affected.update(str(c) for c in part.loc[mask, "customer_id"].unique())
+                        part = part[~mask]
+                    if len(part):
+                        parts.append(part)
+                self._parts = parts
+                if affected:
+                    # a removal can change a customer's date range and latest list: rebuild those customers
+                    rows = [part[part["customer_id"].isin(affected)] for part in self._parts]
+                    self._index.drop(affected)
+                    self._index.update(concat_compact_frames([r for r in rows if len(r)]))
+
+            if len(self._parts) > max_frame_parts:
+                self._parts = [concat_compact_frames(self._parts)]
+            self.version += 1
+
+    def poll(self) -> int:
+        """Apply rows appended to the CSV since the last read; returns the number of rows read."""
+        if self.path is None:
+            return 0
+        with self._poll_lock:
+            return self._poll()
+
+    def _poll(self) -> int:
+        size = os.path.getsize(self.path)
+        if size < self.offset:
+            # truncated or replaced: start over from the new file
+            self.reload()
+            return -1
+        end = complete_lines_end(self.path, size)
+        if end <= self.offset:
+            return 0
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            text = f.read(end - self.offset).decode("utf-8")
+        chunk = pd.read_csv(
+            io.StringIO(text),
+            names=self._columns,
+            header=None,
+            dtype={"pending_tx_id": "string", "customer_id": "string", "pending_amount": "float64"},
+        )
+        added, removed = split_removals(chunk)
+        self.apply_batch(added, removed)
+        self.offset = end
+        return len(chunk)
+
+    def reload(self):
+        with self._poll_lock:
+            fresh = PendingTxStore.load(self.path, self.chunksize, cache_dir=None)
+            with self._lock:
+                self._parts = fresh._parts
+                self._index = fresh._index
+                self._columns = fresh._columns
+                self.offset = fresh.offset
+                self.version += 1
+
+    def start_watching(self, interval: float = pending_tx_poll_seconds):
+        """
+        Poll the CSV for appended rows every `interval` seconds on a daemon thread.
+        A fork pauses the thread and restarts it in the parent and in the child.
+        """
+        if self._watcher is not None:
+            return
+        self._watch_interval = interval
+        _watching_stores.add(self)
+        stop = threading.Event()
+
+        def watch():
+            while not stop.wait(interval):
+                try:
+                    self.poll()
+                except Exception as e:
+                    print(f"pending tx tail failed: {e}")
+
+        thread = threading.Thread(target=watch, name="pending-tx-tail", daemon=True)
+        self._watcher = (thread, stop)
+        thread.start()
+
+    def stop_watching(self):
+        _watching_stores.discard(self)
+        self._pause_watching()
+
+    def _pause_watching(self):
+        if self._watcher is not None:
+            thread, stop = self._watcher
+            stop.set()
+            thread.join()
+            self._watcher = None
+
+# stores tailing their CSV; a thread doesn't survive a fork, and one forked mid-poll
+# would leave the child's locks held, so watchers are stopped around a fork
+_watching_stores = weakref.WeakSet()
+
+def _pause_watchers():
+    for store in list(_watching_stores):
+        store._pause_watching()
+
+def _resume_watchers():
+    for store in list(_watching_stores):
+        store.start_watching(store._watch_interval)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_pause_watchers, after_in_parent=_resume_watchers, after_in_child=_resume_watchers)
+
+def create_llm():
+    from llama_index.llms.gemini import Gemini
+    return Gemini(model="models/gemini-2.0-pro-exp-02-05",api_key=GOOGLE_API_KEY)
+
+# the CSV is read and the Gemini client built on first use, not at import
+services.register("pending_tx_agent.llm", create_llm, per_process=True)
+
+def create_pending_tx_store() -> PendingTxStore:
+    store = PendingTxStore.load()
+    if pending_tx_poll_seconds:
+        store.start_watching(pending_tx_poll_seconds)
+    return store
+
+services.register("pending_tx_agent.pending_tx_store", create_pending_tx_store)
+
+__getattr__ = lazy_attributes(__name__, {
+    "llm": "pending_tx_agent.llm",
+    "pending_tx_store": "pending_tx_agent.pending_tx_store",
+})
+
+def get_pending_tx_store() -> PendingTxStore:
+    return services.get("pending_tx_agent.pending_tx_store")
+
+def stop_tailing():
+    """Stop tailing the CSV, e.g. when the server shuts down (does nothing if the store isn't built)."""
+    if services.is_built("pending_tx_agent.pending_tx_store"):
+        get_pending_tx_store().stop_watching()
+
+def apply_pending_tx_batch(added: Optional[pd.DataFrame] = None, removed: Iterable[str] = ()):
+    """Push appended and settled/removed transactions without touching the CSV."""
+    get_pending_tx_store().apply_batch(added, removed)
+
+def pending_tx_fallback_frame() -> pd.DataFrame:
+    """The frame handed to PandasQueryEngine, with amounts back in pounds as in the CSV."""
+    frame = get_pending_tx_store().frame()
+    return pd.DataFrame({
+        "pending_tx_id": frame["pending_tx_id"],
+        "customer_id": frame["customer_id"],
+        "pending_date": frame["pending_date"],
+        "pending_amount": frame["amount_cents"] / 100,
+    })
+
+_pending_tx_query_engine = None
 
 def create_pending_tx_query_engine():
-    query_engine = PandasQueryEngine(df=df, verbose=True)
-    return query_engine
+    from llama_index.experimental.query_engine import PandasQueryEngine
+
+    global _pending_tx_query_engine
+    version = get_pending_tx_store().version
+    # rebuilt only when a batch changed the transactions
+    if _pending_tx_query_engine is None or _pending_tx_query_engine[0] != version:
+        _pending_tx_query_engine = (
+            version,
+            PandasQueryEngine(df=pending_tx_fallback_frame(), llm=LazyLLM("pending_tx_agent.llm"), verbose=True),
+        )
+    return _pending_tx_query_engine[1]
+
+def get_pending_tx_summary(customer_id: str) -> Optional[PendingTxSummary]:
+    """Return the precomputed pending transaction summary of a customer, or None."""
+    return get_pending_tx_store().summary(customer_id)
+
+customer_id_pattern = re.compile(r"\b(C\d+)\b", re.IGNORECASE)
+rounding_pattern = re.compile(
+    r"\b(?:and\s+)?round(?:ed)?(?:\s+(?:it|off|up))*\s+to\s+(\d+)\s+decimal(?:\s+places?)?\b", re.IGNORECASE
+)
+
+# the fast path answers only questions made of these words (besides one customer id and a
+# rounding clause): any other word, e.g. a month, a date, a number or "since"/"over",
+# may filter the transactions and goes to the LLM
+fast_path_common_words = {
+    "what", "whats", "is", "are", "the", "of", "for", "pending", "transactions", "transaction",
+    "customer", "id", "please", "and", "me", "tell", "give", "show", "get", "does", "do", "have", "has",
+}
+fast_path_count_words = {"how", "many", "count", "number"}
+fast_path_latest_words = {"latest", "recent", "most", "list", "all", "their"}
+fast_path_total_words = {"total", "amount", "sum"}
+fast_path_words = fast_path_common_words | fast_path_count_words | fast_path_latest_words | fast_path_total_words
+
+def format_summary(summary: PendingTxSummary, decimals: int = 2) -> str:
+    latest = ", ".join(
+        f"{tx.pending_tx_id} on {tx.pending_date} for {tx.amount_cents / 100:.2f}" for tx in summary.latest
+    )
+    return (
+        f"Customer {summary.customer_id} has {summary.count} pending transactions "
+        f"totalling {round(summary.total_amount, decimals):.{decimals}f}, "
+        f"dated {summary.first_date} to {summary.last_date}. Latest: {latest}."
+    )
+
+def answer_from_index(query: str) -> Optional[str]:
+    """
+    Answer total / count / latest-transaction questions about one customer id from the
+    aggregate index. Returns None when the question needs the LLM fallback.
+    """
+    customer_ids = {match.upper() for match in customer_id_pattern.findall(query)}
+    if len(customer_ids) != 1:
+        return None
+    rounding = rounding_pattern.search(query)
+    decimals = int(rounding.group(1)) if rounding else 2
+    rest = customer_id_pattern.sub(" ", rounding_pattern.sub(" ", query)).lower().replace("'", "")
+    words = set(re.findall(r"[^\W_]+", rest))
+    if not words <= fast_path_words:
+        return None
+
+    customer_id = customer_ids.pop()
+    summary = get_pending_tx_summary(customer_id)
+    if summary is None:
+        return f"Customer {customer_id} has no pending transactions."
+
+    if words & {"count", "number"} or {"how", "many"} <= words:
+        return f"Customer {customer_id} has {summary.count} pending transactions."
+    if words & {"latest", "recent", "list"}:
+        if "all" in words and summary.count > len(summary.latest):
+            return None
+        return format_summary(summary, decimals)
+    if words & fast_path_total_words:
+        return (
+            f"The total amount of pending transactions for customer {customer_id} "
+            f"is {round(summary.total_amount, decimals):.{decimals}f}."
+        )
+    return None
 
 def get_pending_tx_details(query: str) -> float:
+    response = answer_from_index(query)
+    if response is not None:
+        return response
     query_engine = create_pending_tx_query_engine()
     response = query_engine.query(query)
     return response
 
+async def aget_pending_tx_details(query: str):
+    response = answer_from_index(query)
+    if response is not None:
+        return response
+    # PandasQueryEngine has no real async path: run the LLM fallback off the event loop
+    return await run_sync(create_pending_tx_query_engine().query, query)
+
+def pending_tx_summary(customer_id: str) -> str:
+    """Get the total, count, date range and latest pending transactions of a customer by customer id (e.g. C001)."""
+    summary = get_pending_tx_summary(customer_id)
+    if summary is None:
+        return f"Customer {customer_id} has no pending transactions."
+    return format_summary(summary)
+
+pending_tx_summary_tool = FunctionTool.from_defaults(
+    fn=pending_tx_summary,
+    name="pending_tx_summary",
+    description="get the total amount, number, date range and latest pending transactions of a customer by customer id (e.g. C001)",
+)
+
 # query = "What is the total amount of pending transactions for customer id C001 and round off to 2 decimal places?"
-# print(get_pending_tx_details(query))
\ No newline at end of file
+# print(get_pending_tx_details(query))
+
+# regression check of the fast path against the shipped CSV: python pending_tx_agent.py
+fast_path_answered = [
+    "What is the total amount of pending transactions for customer id C001 and round off to 2 decimal places?",
+    "How many pending transactions does customer C001 have?",
+    "List the latest pending transactions for C001",
+]
+# each filters the transactions or asks for something else: the index can't answer it
+fast_path_fallbacks = [
+    "What is the total amount of pending transactions for C001 in March 2025?",
+    "What is the total amount of pending transactions for C001 on 2025-03-31?",
+    "What is the total amount of pending transactions for C001 since 2025-03-20?",
+    "What is the total amount of pending transactions for C001 over 500?",
+    "Give me a summary of the pending transactions of C001",
+    "What is the average pending transaction amount for C001?",
+]
+
+if __name__ == "__main__":
+    services.set("pending_tx_agent.pending_tx_store", PendingTxStore.load(cache_dir=None))
+    for question in fast_path_answered:
+        answer = answer_from_index(question)
+        assert answer is not None, question
+        print(f"{question}\n  -> {answer}")
+    for question in fast_path_fallbacks:
+        assert answer_from_index(question) is None, question
+        print(f"{question}\n  -> LLM")
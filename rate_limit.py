@@ -0,0 +1,271 @@
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional, Sequence
+
+from llama_index.core.base.llms.types import ChatMessage, LLMMetadata
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+
+class Overloaded(Exception):
+    """Raised instead of queueing when a limiter's queue is already full."""
+
+def overloaded_cause(e: BaseException) -> Optional[Overloaded]:
+    """The Overloaded behind `e`, e.g. one a workflow step raised (wrapped in WorkflowRuntimeError)."""
+    while e is not None:
+        if isinstance(e, Overloaded):
+            return e
+        e = e.__cause__
+    return None
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by sync and async callers across event loops.
+
+    Tokens refill at `rate` per second up to `capacity`. A caller reserves its
+    tokens immediately (the balance may go negative) and then sleeps until they
+    would have been available, so waiting callers are served in arrival order.
+    With `max_waiters`, a caller that would have to queue behind that many others
+    gets Overloaded instead.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_waiters: Optional[int] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.max_waiters = max_waiters
+        self.acquired = 0
+        self.rejected = 0
+        self.waited_seconds = 0.0
+        self._waiters = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate: Optional[float] = None, capacity: Optional[float] = None, max_waiters: Optional[int] = None):
+        with self._lock:
+            self._refill()
+            if rate is not None:
+                self.rate = rate
+            if capacity is not None:
+                self.capacity = capacity
+                self._tokens = min(self._tokens, capacity)
+            if max_waiters is not None:
+                self.max_waiters = max_waiters
+
+    @property
+    def waiters(self) -> int:
+        return self._waiters
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, tokens: float) -> float:
+        """Take the tokens and return how long to wait before using them."""
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if wait and self.max_waiters is not None and self._waiters >= self.max_waiters:
+                self.rejected += 1
+                raise Overloaded(f"{self._waiters} callers already waiting for the rate limiter")
+            self._tokens -= tokens
+            self.acquired += 1
+            self.waited_seconds += wait
+            if wait:
+                self._waiters += 1
+            return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self._waiters -= 1
+
+    async def acquire(self, tokens: float = 1):
+        wait = self._reserve(tokens)
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+
+    def acquire_sync(self, tokens: float = 1):
+        wait = self._reserve(tokens)
+        if wait:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+
+    def summary(self) -> dict:
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "acquired": self.acquired,
+            "rejected": self.rejected,
+            "waiters": self._waiters,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+class AdmissionGate:
+    """
+    Bounds concurrent requests: at most `max_in_flight` run and at most
+    `max_waiting` queue behind them. Anything beyond that is refused with
+    Overloaded right away, so a burst degrades into quick "busy" answers
+    instead of an ever-growing queue of calls that end in 429s.
+    """
+
+    def __init__(self, max_in_flight: int, max_waiting: int):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # semaphores belong to one event loop: keep one per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def configure(self, max_in_flight: Optional[int] = None, max_waiting: Optional[int] = None):
+        if max_in_flight is not None and max_in_flight != self.max_in_flight:
+            self.max_in_flight = max_in_flight
+            self._semaphores = weakref.WeakKeyDictionary()
+        if max_waiting is not None:
+            self.max_waiting = max_waiting
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+        return semaphore
+
+    @asynccontextmanager
+    async def admit(self):
+        if self.in_flight >= self.max_in_flight and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded(f"{self.in_flight} requests running and {self.waiting} waiting")
+        semaphore = self._semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    def summary(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+class LLMCallCount:
+    def __init__(self):
+        self.calls = 0
+
+_llm_call_count: ContextVar[Optional[LLMCallCount]] = ContextVar("llm_call_count", default=None)
+
+@contextmanager
+def count_llm_calls():
+    """
+    Count the calls made through any RateLimitedLLM inside the block, e.g. every
+    call of an agent run. Context variables follow the task, so concurrent blocks
+    in other tasks keep their own counts.
+    """
+    count = LLMCallCount()
+    token = _llm_call_count.set(count)
+    try:
+        yield count
+    finally:
+        _llm_call_count.reset(token)
+
+class RateLimitedLLM(FunctionCallingLLM):
+    """
+    Wraps an LLM so every call first takes a token from a shared TokenBucket.
+
+    Tool calling is delegated to the wrapped LLM, so agents built on the wrapper
+    (e.g. FunctionCallingAgent) behave as with the original model. Each call is
+    also counted for count_llm_calls.
+    """
+
+    _llm: Any = PrivateAttr()
+    _limiter: TokenBucket = PrivateAttr()
+
+    def __init__(self, llm, limiter: TokenBucket, **kwargs: Any):
+        super().__init__(callback_manager=llm.callback_manager, **kwargs)
+        self._llm = llm
+        self._limiter = limiter
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RateLimitedLLM"
+
+    @property
+    def llm(self):
+        return self._llm
+
+    def _acquire_sync(self):
+        self._limiter.acquire_sync()
+        count = _llm_call_count.get()
+        if count is not None:
+            count.calls += 1
+
+    async def _acquire(self):
+        await self._limiter.acquire()
+        count = _llm_call_count.get()
+        if count is not None:
+            count.calls += 1
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._llm.metadata
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        self._acquire_sync()
+        return self._llm.chat(messages, **kwargs)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        self._acquire_sync()
+        return self._llm.complete(prompt, formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        self._acquire_sync()
+        return self._llm.stream_chat(messages, **kwargs)
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        self._acquire_sync()
+        return self._llm.stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        await self._acquire()
+        return await self._llm.achat(messages, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        await self._acquire()
+        return await self._llm.acomplete(prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any):
+        await self._acquire()
+        return await self._llm.astream_chat(messages, **kwargs)
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        await self._acquire()
+        return await self._llm.astream_complete(prompt, formatted=formatted, **kwargs)
+
+    def _prepare_chat_with_tools(self, *args: Any, **kwargs: Any):
+        return self._llm._prepare_chat_with_tools(*args, **kwargs)
+
+    def _validate_chat_with_tools_response(self, *args: Any, **kwargs: Any):
+        return self._llm._validate_chat_with_tools_response(*args, **kwargs)
+
+    def get_tool_calls_from_response(self, *args: Any, **kwargs: Any):
+        return self._llm.get_tool_calls_from_response(*args, **kwargs)
@@ -1,42 +1,189 @@
 from dotenv import load_dotenv
 import os
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.gemini import GeminiEmbedding
+import json
+import threading
+import time
+from embedding_cache import CachedBatchEmbedding
+from numpy_vector_store import NumpyVectorStore
+from semantic_cache import SemanticCache
 from llama_index.core import (
     StorageContext,
     load_index_from_storage,
 )
 from pathlib import Path
-from llama_index.core.settings import Settings
+from services import lazy_attributes, services
+from lazy_llm import LazyEmbedding, LazyLLM
 
 load_dotenv()
 
 persist_dir = "./vector_index"
 
+# "exact" scans every vector, "ivf" uses the IVF index written by ingest_data.py
+ann_index_type = "exact"
+# IVF lists scanned per query: higher is slower but closer to exact recall
+ann_nprobe = 8
+
+# cached answers are reused for questions at least this similar (cosine)
+answer_cache_threshold = 0.95
+answer_cache_ttl = 3600
+answer_cache_size = 1000
+
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-llm = Gemini(model="models/gemini-2.0-flash-001",api_key=GOOGLE_API_KEY)
+def create_llm():
+    from llama_index.llms.gemini import Gemini
+    return Gemini(model="models/gemini-2.0-flash-001",api_key=GOOGLE_API_KEY)
+
+def create_embed_model():
+    from llama_index.embeddings.gemini import GeminiEmbedding
+    return CachedBatchEmbedding(
+        GeminiEmbedding(model_name="models/text-embedding-004", api_key=GOOGLE_API_KEY)
+    )
+
+def create_answer_cache():
+    return SemanticCache(
+        LazyEmbedding("retriever.embed_model"),
+        threshold=answer_cache_threshold,
+        ttl=answer_cache_ttl,
+        max_entries=answer_cache_size,
+    )
+
+# Gemini clients and the answer cache are built on first use, not at import
+services.register("retriever.llm", create_llm, per_process=True)
+services.register("retriever.embed_model", create_embed_model, per_process=True)
+services.register("retriever.answer_cache", create_answer_cache)
+
+__getattr__ = lazy_attributes(__name__, {
+    "llm": "retriever.llm",
+    "embed_model": "retriever.embed_model",
+    "answer_cache": "retriever.answer_cache",
+})
+
+class IndexRegistry:
+    """
+    Process-wide holder of the persisted vector index.
+
+    The index is loaded lazily on first use and kept in memory. Query engines are
+    built once per set of parameters (e.g. similarity_top_k) and shared. The files
+    under persist_dir are re-checked at most every `check_interval` seconds and the
+    index is reloaded only when their size or mtime changed.
+    """
+
+    def __init__(self, persist_dir: str, check_interval: float = 1.0, use_ann: bool = False, nprobe: int = 8):
+        self.persist_dir = persist_dir
+        self.check_interval = check_interval
+        self.use_ann = use_ann
+        self.nprobe = nprobe
+        # bumped on every (re)load so dependent caches can invalidate themselves
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._index = None
+        self._fingerprint = None
+        self._last_check = 0.0
+        self._query_engines = {}
+
+    def _compute_fingerprint(self):
+        """Return a cheap (path, size, mtime) snapshot of the files in persist_dir."""
+        entries = []
+        for path in sorted(Path(self.persist_dir).rglob("*")):
+            if path.is_file():
+                stat = path.stat()
+                entries.append((str(path), stat.st_size, stat.st_mtime_ns))
+        return tuple(entries)
 
-embed_model = GeminiEmbedding(model_name="models/text-embedding-004", api_key=GOOGLE_API_KEY)
+    def _is_stale(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        return self._compute_fingerprint() != self._fingerprint
 
-Settings.llm = llm
-Settings.embed_model = embed_model
+    def get_index(self):
+        """Return the loaded index, (re)loading it if the persisted files changed."""
+        if self._index is not None and not self._is_stale():
+            return self._index
 
-def get_query_engine():
+        with self._lock:
+            if not Path(self.persist_dir).exists():
+                raise ValueError("No index found. Please ingest documents first.")
+
+            fingerprint = self._compute_fingerprint()
+            if self._index is None or fingerprint != self._fingerprint:
+                print(f"loading vector index from {self.persist_dir}")
+                storage_context = StorageContext.from_defaults(
+                    persist_dir=self.persist_dir,
+                    vector_store=NumpyVectorStore.from_persist_dir(
+                        self.persist_dir, use_ann=self.use_ann, nprobe=self.nprobe
+                    ),
+                )
+                self._index = load_index_from_storage(
+                    storage_context, embed_model=LazyEmbedding("retriever.embed_model")
+                )
+                self._fingerprint = fingerprint
+                self._query_engines = {}
+                self.generation += 1
+            self._last_check = time.monotonic()
+            return self._index
+
+    def get_query_engine(self, **kwargs):
+        """Return a shared query engine for the given as_query_engine() parameters."""
+        index = self.get_index()
+        key = json.dumps(kwargs, sort_keys=True, default=str)
+        with self._lock:
+            if index is not self._index:
+                # reloaded by another thread in the meantime
+                index = self.get_index()
+            query_engine = self._query_engines.get(key)
+            if query_engine is None:
+                query_engine = index.as_query_engine(llm=LazyLLM("retriever.llm"), **kwargs)
+                self._query_engines[key] = query_engine
+            return query_engine
+
+    def reset(self):
+        """Drop the loaded index so the next call reloads it from disk."""
+        with self._lock:
+            self._index = None
+            self._fingerprint = None
+            self._query_engines = {}
+
+index_registry = IndexRegistry(persist_dir, use_ann=ann_index_type == "ivf", nprobe=ann_nprobe)
+
+def get_query_engine(similarity_top_k: int = 5, nprobe: int = None):
     """Initialize and return the query engine"""
-    if not Path(persist_dir).exists():
-        raise ValueError("No index found. Please ingest documents first.")
-        
-    storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
-    index = load_index_from_storage(storage_context)
-    return index.as_query_engine(similarity_top_k=5)
+    if nprobe is None:
+        return index_registry.get_query_engine(similarity_top_k=similarity_top_k)
+    return index_registry.get_query_engine(
+        similarity_top_k=similarity_top_k, vector_store_kwargs={"nprobe": nprobe}
+    )
+
+def query_interest_rates(question: str) -> str:
+    """Answer a question from the interest rate index, reusing answers to similar questions."""
+    query_engine = get_query_engine()
+    generation = index_registry.generation
+    answer_cache = services.get("retriever.answer_cache")
+    answer_cache.invalidate(generation)
+    answer, vector = answer_cache.get(question)
+    if answer is None:
+        answer = str(query_engine.query(question))
+        answer_cache.put(question, answer, vector, generation=generation)
+    return answer
+
+async def aquery_interest_rates(question: str) -> str:
+    """Async version of query_interest_rates."""
+    query_engine = get_query_engine()
+    generation = index_registry.generation
+    answer_cache = services.get("retriever.answer_cache")
+    answer_cache.invalidate(generation)
+    answer, vector = await answer_cache.aget(question)
+    if answer is None:
+        answer = str(await query_engine.aquery(question))
+        answer_cache.put(question, answer, vector, generation=generation)
+    return answer
 
 def search_documents(query: str) -> str:
     """Search through the bank account interest rate documents for relevant information."""
-    query_engine = get_query_engine()
-    response = query_engine.query(query)
-    return str(response)
+    return query_interest_rates(query)
 
 # query = "Whats the Cash ISA Saver's annual interest rate for an account opened after 18/02/25?"
 # response = search_documents(query)
-# print(response)
\ No newline at end of file
+# print(response)
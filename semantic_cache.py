@@ -0,0 +1,143 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+# numbers and dates must match exactly: "opened after 18/02/25" and "opened after
+# 18/02/24" embed almost identically but need different answers
+number_pattern = re.compile(r"\d+(?:[./-]\d+)*")
+
+def numeric_tokens(text: str) -> frozenset:
+    return frozenset(number_pattern.findall(text))
+
+class CacheEntry:
+    def __init__(self, question: str, answer: str, vector: np.ndarray, created_at: float):
+        self.question = question
+        self.answer = answer
+        self.vector = vector
+        self.numbers = numeric_tokens(question)
+        self.created_at = created_at
+
+class SemanticCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+class SemanticCache:
+    """
+    Answer cache looked up by question similarity instead of exact text.
+
+    A question hits when the cosine similarity of its embedding to a cached question
+    is at least `threshold` and both contain the same numbers/dates. Entries expire
+    after `ttl` seconds, the least recently used entry is evicted beyond
+    `max_entries`, and everything is dropped when the index generation changes.
+    """
+
+    def __init__(self, embed_model, threshold: float = 0.95, ttl: float = 3600.0, max_entries: int = 1000):
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = SemanticCacheStats()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._generation = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalise(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def invalidate(self, generation=None):
+        """Drop every entry; with a generation, only if it differs from the last one seen."""
+        with self._lock:
+            if generation is not None and generation == self._generation:
+                return
+            if self._entries:
+                self.stats.invalidations += 1
+            self._generation = generation
+            self._entries.clear()
+            self._matrix = None
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self.stats.expirations += len(expired)
+            self._matrix = None
+
+    def _lookup(self, question: str, vector: np.ndarray) -> Optional[str]:
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            if self._entries:
+                if self._matrix is None:
+                    self._keys = list(self._entries)
+                    self._matrix = np.vstack([self._entries[key].vector for key in self._keys])
+                scores = self._matrix @ vector
+                numbers = numeric_tokens(question)
+                for position in np.argsort(-scores):
+                    if scores[position] < self.threshold:
+                        break
+                    key = self._keys[position]
+                    entry = self._entries[key]
+                    if entry.numbers == numbers:
+                        self._entries.move_to_end(key)
+                        self.stats.hits += 1
+                        return entry.answer
+            self.stats.misses += 1
+            return None
+
+    def _put(self, question: str, answer: str, vector: np.ndarray):
+        with self._lock:
+            self._entries[question] = CacheEntry(question, answer, vector, time.time())
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+            self._matrix = None
+
+    def get(self, question: str):
+        """Return (cached answer or None, question embedding to pass to put())."""
+        vector = self._normalise(self.embed_model.get_query_embedding(question))
+        return self._lookup(question, vector), vector
+
+    async def aget(self, question: str):
+        vector = self._normalise(await self.embed_model.aget_query_embedding(question))
+        return self._lookup(question, vector), vector
+
+    def put(self, question: str, answer: str, vector=None, generation=None):
+        """Store an answer; skipped if it was computed against an index generation since replaced."""
+        if generation is not None and generation != self._generation:
+            return
+        if vector is None:
+            vector = self._normalise(self.embed_model.get_query_embedding(question))
+        self._put(question, answer, vector)
@@ -0,0 +1,302 @@
+"""
+HTTP service for the banking assistant: one process serves many customers at once.
+
+    POST /chat             {"session_id": "...", "message": "..."}  chat with the AgentWorkflow of app.py
+    POST /advisor          {"query": "..."}                         CustomerInvestmentAdvisorAgent answer and LLM usage
+    POST /advisor/stream   {"query": "..."}                         the same as server-sent events: progress...,
+                                                                    token... and timing per answer written,
+                                                                    usage, answer (or error)
+    GET  /ready                                                     200 once warmed up, 503 before
+    GET  /stats                                                     sessions, admission gates and services
+
+Tokens with "draft": true belong to an answer the reviewer may still reject:
+show it as a draft until the answer event confirms it, or replace it when the
+tokens of the next attempt arrive.
+
+Requests run concurrently on one event loop. Beyond the admission limits a
+request gets 503 right away; one running longer than its timeout is cancelled
+and gets 504, as is an advisor stream whose client goes away. Run with
+
+    python server.py --port 8000
+    python server.py --fake-llm --llm-latency 0.2 --llm-requests-per-second 100   # no API calls, for bench_server.py
+    python server.py --workers 4                    # warm up once, then fork 4 workers on one socket
+
+A chat session lives in the memory of the process that serves it, and forked
+workers take connections from their shared socket in no particular order, so
+consecutive turns of a session could reach different copies of it. With
+--workers, /chat is therefore refused with 501 and only the stateless advisor
+endpoints are served; run chat in a single process (or one per port behind a
+proxy that routes by session id).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+from collections import Counter
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+import pending_tx_agent
+import warmup
+from app import sessions
+from async_tools import run_sync
+from rate_limit import AdmissionGate, Overloaded, overloaded_cause
+from services import services
+from token_stream import stream_stats
+from wf_agents import ProgressEvent, StreamTimingEvent, TokenEvent, UsageEvent, llm_rate_limiter, request_gate
+from wf_agents_app import start_advisor
+
+load_dotenv()
+
+# seconds a request may run before it is cancelled and answered with 504
+chat_timeout = 120
+advisor_timeout = 600
+
+# chat requests running at once per process, and queued behind them before 503s
+# (advisor requests go through wf_agents.request_gate)
+max_in_flight_chats = 32
+max_waiting_chats = 128
+
+chat_gate = AdmissionGate(max_in_flight_chats, max_waiting_chats)
+
+# set from the command line: warm up before taking traffic, and serve /chat (not with --workers)
+warm_up_on_start = True
+serve_chat = True
+ready_file = warmup.ready_file
+
+request_counts = Counter()
+
+class RequestTimeout(Exception):
+    pass
+
+class ChatRequest(BaseModel):
+    session_id: str
+    message: str
+
+class AdvisorRequest(BaseModel):
+    query: str
+
+def usage_dict(event: UsageEvent) -> dict:
+    return {
+        "calls": event.calls,
+        "llm_calls": event.llm_calls,
+        "estimated_tokens": event.estimated_tokens,
+        "review_rounds": event.review_rounds,
+        "budget_exhausted": event.budget_exhausted,
+    }
+
+def timing_dict(event: StreamTimingEvent) -> dict:
+    return {
+        "attempt": event.attempt,
+        "first_token_ms": event.first_token_ms,
+        "total_ms": event.total_ms,
+        "chunks": event.chunks,
+    }
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that calls `release` however it ends: a client that goes
+    away before the first chunk never runs the body generator, nor its finally.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await self.release()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # forked workers start ready: the parent warmed up and owns the ready file
+    warmed_up_here = False
+    if not warmup.is_ready():
+        if warm_up_on_start:
+            await run_sync(warmup.warm_up, path=ready_file)
+            warmed_up_here = True
+        else:
+            warmup.readiness.set()
+    yield
+    pending_tx_agent.stop_tailing()
+    await sessions.save_all()
+    if warmed_up_here:
+        warmup.clear_ready(ready_file)
+
+app = FastAPI(title="Banking assistant", lifespan=lifespan)
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, e: Overloaded):
+    request_counts["rejected"] += 1
+    return JSONResponse({"error": f"busy: {e}"}, status_code=503, headers={"Retry-After": "1"})
+
+@app.exception_handler(RequestTimeout)
+async def timed_out(request: Request, e: RequestTimeout):
+    request_counts["timed_out"] += 1
+    return JSONResponse({"error": str(e)}, status_code=504)
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    request_counts["chat"] += 1
+    if not serve_chat:
+        return JSONResponse(
+            {"error": "chat sessions are kept per process: run the server without --workers for /chat"},
+            status_code=501,
+        )
+    async with chat_gate.admit():
+        try:
+            # cancelling sessions.run() cancels the workflow run
+            response = await asyncio.wait_for(sessions.run(request.session_id, request.message), chat_timeout)
+        except asyncio.TimeoutError:
+            raise RequestTimeout(f"no answer within {chat_timeout} s")
+    return {"session_id": request.session_id, "answer": str(response)}
+
+async def collect_advisor(handler) -> dict:
+    usage = None
+    timings = []
+    async for event in handler.stream_events():
+        if isinstance(event, UsageEvent):
+            usage = usage_dict(event)
+        elif isinstance(event, StreamTimingEvent):
+            timings.append(timing_dict(event))
+    return {"answer": str(await handler), "usage": usage, "answer_timings": timings}
+
+@app.post("/advisor")
+async def advisor(request: AdvisorRequest):
+    request_counts["advisor"] += 1
+    async with request_gate.admit():
+        handler = start_advisor(request.query, verbose=False, timeout=None)
+        try:
+            return await asyncio.wait_for(collect_advisor(handler), advisor_timeout)
+        except asyncio.TimeoutError:
+            await handler.cancel_run()
+            raise RequestTimeout(f"no answer within {advisor_timeout} s")
+        except Exception as e:
+            # an LLM call turned away by the rate limiter fails the run: answer 503 as for a full gate
+            if overloaded_cause(e) is None:
+                raise
+            raise overloaded_cause(e)
+
+@app.post("/advisor/stream")
+async def advisor_stream(request: AdvisorRequest):
+    request_counts["advisor_stream"] += 1
+    # admit before the response starts, so a busy server still answers 503
+    admission = AsyncExitStack()
+    await admission.enter_async_context(request_gate.admit())
+    try:
+        handler = start_advisor(request.query, verbose=False, timeout=None)
+    except BaseException:
+        await admission.aclose()
+        raise
+
+    async def release():
+        # timed out, failed or the client went away (even before the stream started): stop the run
+        if not handler.is_done():
+            await handler.cancel_run()
+        await admission.aclose()
+
+    async def events():
+        try:
+            async with asyncio.timeout(advisor_timeout):
+                async for event in handler.stream_events():
+                    if isinstance(event, TokenEvent):
+                        # a token of a later attempt starts a new answer that replaces the last one
+                        yield sse("token", {"delta": event.delta, "attempt": event.attempt, "draft": event.draft})
+                    elif isinstance(event, StreamTimingEvent):
+                        yield sse("timing", timing_dict(event))
+                    elif isinstance(event, ProgressEvent):
+                        yield sse("progress", {"progress": event.progress})
+                    elif isinstance(event, UsageEvent):
+                        yield sse("usage", usage_dict(event))
+                yield sse("answer", {"answer": str(await handler)})
+        except TimeoutError:
+            request_counts["timed_out"] += 1
+            yield sse("error", {"error": f"no answer within {advisor_timeout} s"})
+        except Exception as e:
+            if overloaded_cause(e) is not None:
+                # the 200 is already sent: a busy error event stands in for the 503
+                request_counts["rejected"] += 1
+                yield sse("error", {"error": f"busy: {overloaded_cause(e)}", "status": 503})
+            else:
+                yield sse("error", {"error": str(e)})
+
+    return ReleasingStreamingResponse(
+        events(), release, media_type="text/event-stream", headers={"Cache-Control": "no-cache"},
+    )
+
+@app.get("/ready")
+async def ready():
+    if not warmup.is_ready():
+        return JSONResponse({"ready": False}, status_code=503)
+    return {"ready": True}
+
+@app.get("/stats")
+async def stats():
+    return {
+        "pid": os.getpid(),
+        "requests": dict(request_counts),
+        "chat_gate": chat_gate.summary(),
+        "advisor_gate": request_gate.summary(),
+        "sessions": sessions.summary(),
+        "services": services.summary()["built"],
+        "answer_streams": {source: stats.summary() for source, stats in stream_stats.items()},
+    }
+
+def serve(host: str, port: int, sock: socket.socket = None):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    asyncio.run(server.serve(sockets=[sock] if sock is not None else None))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=0, help="warm up, then fork this many workers sharing the socket (no /chat)")
+    parser.add_argument("--no-warmup", action="store_true", help="take traffic right away, building everything on first use")
+    parser.add_argument("--fake-llm", action="store_true", help="answer with fake_llm.FakeLLM instead of calling the APIs")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="seconds per streamed word of a fake answer")
+    parser.add_argument("--llm-requests-per-second", type=float, default=None, help="LLM rate limit of the advisor")
+    parser.add_argument("--ready-file", default=ready_file)
+    args = parser.parse_args()
+
+    ready_file = args.ready_file
+    if args.llm_requests_per_second:
+        llm_rate_limiter.configure(rate=args.llm_requests_per_second, capacity=max(1, int(args.llm_requests_per_second)))
+    # fake LLM answers would only prime the caches with fake answers
+    warm_up_on_start = not (args.no_warmup or args.fake_llm)
+
+    if args.workers:
+        if not warm_up_on_start:
+            parser.error("--workers warms up before forking: drop --no-warmup and --fake-llm")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((args.host, args.port))
+        sock.listen(2048)
+        serve_chat = False
+
+        def worker(index: int):
+            # warmed up in the parent before the fork
+            warmup.readiness.set()
+            serve(args.host, args.port, sock)
+
+        print(f"serving on http://{args.host}:{args.port} with {args.workers} workers (advisor only, no /chat)")
+        warmup.run_forked(worker, args.workers, args.ready_file)
+    else:
+        if args.fake_llm:
+            from fake_llm import use_fake_llm
+            use_fake_llm(latency=args.llm_latency, token_latency=args.llm_token_latency)
+        print(f"serving on http://{args.host}:{args.port}")
+        serve(args.host, args.port)
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+class Services:
+    """
+    Process-wide container of heavy resources (LLM clients, the customer DB, the
+    pending transactions store...), each built by its factory on first use.
+
+    Modules register a factory under "<module>.<name>" at import time, which is
+    cheap, and call get() where they used to read a module global. A resource is
+    built once even when several threads ask for it at the same time; set()
+    replaces one, e.g. with a fake LLM in benchmarks.
+
+    Resources registered with per_process=True (network clients, SQLite
+    connections) are dropped in a forked child and built again there, while
+    everything else (the loaded index, the customer and pending transaction
+    data) stays shared with the parent copy-on-write.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._per_process = set()
+        self._lock = threading.Lock()
+        self.build_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], per_process: bool = False):
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            if per_process:
+                self._per_process.add(name)
+
+    def get(self, name: str) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        if name not in self._factories:
+            raise KeyError(f"no service registered as {name!r}")
+        with self._locks[name]:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.build_seconds[name] = time.perf_counter() - start
+                print(f"built {name} in {self.build_seconds[name] * 1000:.0f} ms")
+            return self._instances[name]
+
+    def set(self, name: str, instance: Any):
+        with self._lock:
+            self._instances[name] = instance
+            self._locks.setdefault(name, threading.Lock())
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: Optional[str] = None):
+        """Forget one built resource (or all), so the next get() builds it again."""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def after_fork(self):
+        # locks may have been held by another thread at fork time
+        self._lock = threading.Lock()
+        self._locks = {name: threading.Lock() for name in self._locks}
+        for name in self._per_process:
+            self._instances.pop(name, None)
+
+    def summary(self) -> dict:
+        return {
+            "registered": sorted(self._factories),
+            "built": sorted(self._instances),
+            "built_ms": {name: round(seconds * 1000, 1) for name, seconds in self.build_seconds.items()},
+        }
+
+services = Services()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=services.after_fork)
+
+def lazy_attributes(module_name: str, names: Dict[str, str]) -> Callable[[str], Any]:
+    """
+    A module-level __getattr__ that resolves former module globals through services,
+    so `from retriever import llm` keeps working without building anything at import.
+    """
+
+    def __getattr__(name: str):
+        if name in names:
+            return services.get(names[name])
+        raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+
+    return __getattr__
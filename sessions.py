@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from llama_index.core.workflow import Context, JsonSerializer
+
+from async_tools import run_sync
+
+# sessions kept in memory per manager; the least recently used are written to session_dir
+max_resident_sessions = 100
+session_dir = "./sessions"
+
+# sessions written out and not back for this long are forgotten, None keeps them
+session_ttl_seconds = 7 * 24 * 3600
+
+# seconds a cancelled run gets to stop before its session is released
+cancel_grace_seconds = 5
+
+class SessionStats:
+    def __init__(self):
+        self.created = 0
+        self.restored = 0
+        self.evicted = 0
+        self.runs = 0
+        self.running = 0
+        self.max_running = 0
+        self.saved_bytes = 0
+        self.saves = 0
+
+    def summary(self, resident: int) -> dict:
+        return {
+            "resident": resident,
+            "created": self.created,
+            "restored": self.restored,
+            "evicted": self.evicted,
+            "runs": self.runs,
+            "running": self.running,
+            "max_running": self.max_running,
+            # serialized size of a session context, a proxy for its memory
+            "mean_session_bytes": self.saved_bytes // self.saves if self.saves else 0,
+        }
+
+class SessionManager:
+    """
+    One workflow Context per customer session instead of one shared by everyone.
+
+    Runs of the same session are serialized (its chat history and state are one
+    conversation), while different sessions run concurrently. Each run works on
+    a copy of the session's context, which replaces it once the run succeeds: a
+    run that fails or is cancelled leaves the session as it was. At most
+    `max_resident` contexts stay in memory: the least recently used idle one is
+    serialized to `directory` and restored from there when its session returns;
+    its file is removed once restored, or once older than `ttl` seconds. New sessions get their chat memory from `memory_factory`, if given.
+    """
+
+    def __init__(
+        self,
+        workflow,
+        max_resident: int = max_resident_sessions,
+        directory: str = session_dir,
+        memory_factory: Optional[Callable] = None,
+        ttl: Optional[float] = session_ttl_seconds,
+    ):
+        self.workflow = workflow
+        self.ttl = ttl
+        self.memory_factory = memory_factory
+        self.max_resident = max_resident
+        self.directory = directory
+        self.stats = SessionStats()
+        self._serializer = JsonSerializer()
+        # from_dict keeps the lists it is given: every context gets its own copy
+        self._blank = json.dumps(Context(workflow).to_dict(serializer=self._serializer))
+        self._contexts: "OrderedDict[str, Context]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users = Counter()
+
+    def _path(self, session_id: str) -> str:
+        # session ids come from clients: never use them as file names directly
+        return os.path.join(self.directory, hashlib.sha256(session_id.encode()).hexdigest() + ".json")
+
+    def _state(self, ctx: Context) -> dict:
+        # the session's state is its globals (memory, agent state); the events the last
+        # run left behind (its unread stream, broker log) would only pile up turn after turn
+        return {**json.loads(self._blank), "globals": ctx.to_dict(serializer=self._serializer)["globals"]}
+
+    def _dump(self, ctx: Context) -> str:
+        return json.dumps(self._state(ctx))
+
+    def _copy(self, ctx: Context) -> Context:
+        return Context.from_dict(self.workflow, self._state(ctx), serializer=self._serializer)
+
+    def _write(self, session_id: str, data: str):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(session_id)
+        with open(path + ".tmp", "w") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        self.stats.saves += 1
+        self.stats.saved_bytes += len(data)
+
+    def _expired(self, path: str) -> bool:
+        return self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl
+
+    def _read(self, session_id: str) -> Optional[dict]:
+        """Read a written-out session and remove its file: the resident context is the session now."""
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return None
+        data = None
+        if not self._expired(path):
+            with open(path) as f:
+                data = json.load(f)
+        os.remove(path)
+        return data
+
+    def prune(self) -> int:
+        """Remove session files older than the ttl, returns how many."""
+        if self.ttl is None or not os.path.isdir(self.directory):
+            return 0
+        count = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".json") and self._expired(path):
+                os.remove(path)
+                count += 1
+        return count
+
+    async def context(self, session_id: str) -> Context:
+        """The session's context: resident, restored from disk or new."""
+        ctx = self._contexts.get(session_id)
+        if ctx is not None:
+            self._contexts.move_to_end(session_id)
+            return ctx
+        data = await run_sync(self._read, session_id)
+        if data is not None:
+            ctx = Context.from_dict(self.workflow, data, serializer=self._serializer)
+            self.stats.restored += 1
+        else:
+            ctx = Context(self.workflow)
+            if self.memory_factory is not None:
+                await ctx.set("memory", self.memory_factory())
+            self.stats.created += 1
+        self._contexts[session_id] = ctx
+        return ctx
+
+    @asynccontextmanager
+    async def _session_lock(self, session_id: str):
+        """Hold the session's lock; it is forgotten once nobody holds or waits for it."""
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._lock_users[session_id] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[session_id] -= 1
+            if not self._lock_users[session_id]:
+                del self._lock_users[session_id]
+                self._locks.pop(session_id, None)
+
+    async def _evict(self):
+        for session_id in list(self._contexts):
+            if len(self._contexts) <= self.max_resident:
+                break
+            # a session that is running or waiting to is not written out from under it
+            if session_id in self._locks or session_id not in self._contexts:
+                continue
+            # a run of the session arriving during the write waits for it, then reads the file
+            async with self._session_lock(session_id):
+                ctx = self._contexts.pop(session_id)
+                await run_sync(self._write, session_id, self._dump(ctx))
+                self.stats.evicted += 1
+
+    async def run(self, session_id: str, user_msg: str, **kwargs: Any):
+        """
+        Run the workflow for one message of a session and return the result.
+        Cancelling the call (e.g. from asyncio.wait_for) cancels the workflow run.
+        """
+        try:
+            async with self._session_lock(session_id):
+                self.stats.runs += 1
+                self.stats.running += 1
+                self.stats.max_running = max(self.stats.max_running, self.stats.running)
+                try:
+                    # a fresh copy: the workflow shuts a context down only after handing
+                    # back the result, which would cancel a next run started on it
+                    ctx = self._copy(await self.context(session_id))
+                    handler = self.workflow.run(user_msg=user_msg, ctx=ctx, **kwargs)
+                    try:
+                        result = await asyncio.shield(handler)
+                    except asyncio.CancelledError:
+                        # the request timed out or went away: stop the run before the next
+                        # one of this session starts
+                        await handler.cancel_run()
+                        await asyncio.wait([handler], timeout=cancel_grace_seconds)
+                        raise
+                    self._contexts[session_id] = ctx
+                    return result
+                finally:
+                    self.stats.running -= 1
+        finally:
+            await self._evict()
+
+    def session_bytes(self, session_id: str) -> int:
+        """Serialized size of a resident session's context (0 if it is not in memory)."""
+        ctx = self._contexts.get(session_id)
+        return len(self._dump(ctx)) if ctx is not None else 0
+
+    async def save_all(self):
+        """Write every resident session to disk, e.g. before the process exits, and prune expired ones."""
+        await run_sync(self.prune)
+        for session_id, ctx in list(self._contexts.items()):
+            await run_sync(self._write, session_id, self._dump(ctx))
+
+    def drop(self, session_id: str):
+        """Forget a session, in memory and on disk."""
+        self._contexts.pop(session_id, None)
+        self._locks.pop(session_id, None)
+        if os.path.exists(self._path(session_id)):
+            os.remove(self._path(session_id))
+
+    def summary(self) -> dict:
+        return self.stats.summary(resident=len(self._contexts))
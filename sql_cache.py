@@ -0,0 +1,284 @@
+import asyncio
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.base.response.schema import Response
+from llama_index.core.indices.struct_store.sql_query import DEFAULT_RESPONSE_SYNTHESIS_PROMPT_V2
+from sqlalchemy import text
+
+# entities masked out of a question, most specific first
+entity_patterns = [
+    ("email", re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")),
+    ("customer_id", re.compile(r"\b[A-Z]\d{3,}\b")),
+    ("date", re.compile(r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b")),
+    ("number", re.compile(r"\b\d+(?:\.\d+)?\b")),
+    ("name", re.compile(r"\b[A-Z][a-z]+(?:[ -][A-Z][a-z]+)+\b")),
+]
+
+# capitalised words that start a question rather than a name ("List Bob Brown's details")
+name_stopwords = {
+    "What", "Which", "Who", "Whose", "When", "Where", "How", "List", "Show", "Give", "Get",
+    "Find", "Tell", "Is", "Does", "Do", "Please", "The", "All", "Customer", "Customers",
+}
+
+write_keywords = re.compile(
+    r"\b(insert|update|delete|replace|upsert|merge|drop|alter|create|truncate|attach|detach|"
+    r"pragma|vacuum|reindex|analyze|grant|revoke)\b",
+    re.IGNORECASE,
+)
+
+sql_literal_pattern = re.compile(r"'((?:[^']|'')*)'")
+
+def mask_entities(question: str) -> Tuple[str, List[str]]:
+    """
+    Returns (template, entity values): "What is Bob Brown's balance?" ->
+    ("what is {name}'s balance", ["Bob Brown"])
+    """
+    values = []
+
+    def replace(kind, match):
+        value = match.group(0)
+        if kind == "name":
+            words = value.split(" ")
+            while words and words[0] in name_stopwords:
+                words.pop(0)
+            if not words:
+                return value
+            prefix = value[:len(value) - len(" ".join(words))]
+            values.append(" ".join(words))
+            return prefix + "{name}"
+        values.append(value)
+        return "{" + kind + "}"
+
+    # one pass over all patterns keeps the values in question order
+    combined = re.compile("|".join(f"(?P<{kind}>{pattern.pattern})" for kind, pattern in entity_patterns))
+    template = combined.sub(lambda m: replace(m.lastgroup, m), question)
+    template = re.sub(r"\s+", " ", template).strip().rstrip("?.!").lower()
+    return template, values
+
+def strip_sql_comments(sql: str) -> str:
+    return re.sub(r"--[^\n]*|/\*.*?\*/", " ", sql, flags=re.DOTALL)
+
+def is_read_only_sql(sql: str) -> bool:
+    """A single SELECT (or WITH ... SELECT) statement without write or admin keywords."""
+    statement = strip_sql_comments(sql).strip().rstrip(";").strip()
+    if not statement or ";" in sql_literal_pattern.sub("''", statement):
+        return False
+    if not re.match(r"(select|with)\b", statement, re.IGNORECASE):
+        return False
+    return not write_keywords.search(sql_literal_pattern.sub("''", statement))
+
+def parameterize_sql(sql: str, values: List[str]):
+    """
+    Replaces every SQL string/number literal containing an entity value with a bound
+    parameter. Returns (sql, [(value index, prefix, suffix)]) or None if any value
+    isn't used as a literal, in which case the SQL can't be reused for other values.
+    """
+    params = []
+    used = set()
+
+    def replace_string(match):
+        literal = match.group(1).replace("''", "'")
+        for i, value in enumerate(values):
+            position = literal.find(value)
+            if position != -1:
+                used.add(i)
+                params.append((i, literal[:position], literal[position + len(value):]))
+                return f":p{len(params) - 1}"
+        return match.group(0)
+
+    templated = sql_literal_pattern.sub(replace_string, sql)
+
+    for i, value in enumerate(values):
+        if i in used or not re.fullmatch(r"\d+(?:\.\d+)?", value):
+            continue
+        number = re.compile(rf"(?<![\w.:']){re.escape(value)}(?![\w.'])")
+        if number.search(templated):
+            params.append((i, "", ""))
+            templated = number.sub(f"CAST(:p{len(params) - 1} AS NUMERIC)", templated)
+            used.add(i)
+
+    if len(used) != len(values):
+        return None
+    return templated, params
+
+def bind_params(params, values: List[str]) -> dict:
+    return {f"p{n}": prefix + values[i] + suffix for n, (i, prefix, suffix) in enumerate(params)}
+
+def format_rows(col_keys: List[str], rows) -> str:
+    if not rows:
+        return "No matching rows."
+    return "\n".join(", ".join(f"{key}: {value}" for key, value in zip(col_keys, row)) for row in rows)
+
+class SQLTemplate:
+    def __init__(self, sql: str, params):
+        self.sql = sql
+        self.params = params
+
+class SQLTemplateCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # generated SQL that couldn't be parameterized, wasn't read-only or didn't re-run identically
+        self.uncacheable = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "uncacheable": self.uncacheable,
+            "evictions": self.evictions,
+        }
+
+class SQLTemplateCache:
+    """
+    Text-to-SQL cache in front of an NLSQLTableQueryEngine.
+
+    Questions are reduced to templates with their entities (names, ids, emails,
+    dates, numbers) masked. The SQL generated for the first question of a template
+    is cached with those entities turned into bound parameters, after checking it is
+    a read-only SELECT that re-runs to the same rows. Later questions with the same
+    template skip SQL generation; with synthesize=False they skip the LLM entirely
+    and the rows are returned as text.
+
+    aquery() runs the blocking database work on `executor` (the loop's default
+    executor if None), so its size bounds the concurrent customer queries.
+    """
+
+    def __init__(
+        self,
+        query_engine,
+        sql_database,
+        llm=None,
+        synthesize: bool = True,
+        max_templates: int = 1000,
+        executor=None,
+    ):
+        self.query_engine = query_engine
+        self.sql_database = sql_database
+        self.llm = llm
+        self.synthesize = synthesize
+        self.max_templates = max_templates
+        self.executor = executor
+        self.stats = SQLTemplateCacheStats()
+        self._lock = threading.Lock()
+        self._templates = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+    def _lookup(self, template: str) -> Optional[SQLTemplate]:
+        with self._lock:
+            entry = self._templates.get(template)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._templates.move_to_end(template)
+            self.stats.hits += 1
+            return entry
+
+    def _store(self, template: str, entry: SQLTemplate):
+        with self._lock:
+            self._templates[template] = entry
+            self._templates.move_to_end(template)
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+                self.stats.evictions += 1
+
+    def run_sql(self, sql: str, params: dict):
+        """Runs cached SQL with bound parameters; SQLite connections are switched to query_only."""
+        if not is_read_only_sql(sql):
+            raise ValueError(f"Refusing to run non read-only SQL: {sql}")
+        engine = self.sql_database.engine
+        with engine.connect() as connection:
+            sqlite = engine.dialect.name == "sqlite"
+            if sqlite:
+                connection.exec_driver_sql("PRAGMA query_only = ON")
+            try:
+                result = connection.execute(text(sql), params)
+                return list(result.keys()), [tuple(row) for row in result.fetchall()]
+            finally:
+                if sqlite:
+                    connection.exec_driver_sql("PRAGMA query_only = OFF")
+
+    def _learn(self, template: str, values: List[str], response):
+        """Caches the SQL behind an engine response if it generalises to other entity values."""
+        sql = response.metadata.get("sql_query") if response.metadata else None
+        cached = None
+        if sql and is_read_only_sql(sql):
+            parameterized = parameterize_sql(sql, values)
+            if parameterized is not None:
+                entry = SQLTemplate(*parameterized)
+                try:
+                    _, rows = self.run_sql(entry.sql, bind_params(entry.params, values))
+                    # SQLDatabase.run_sql truncates long strings in its result
+                    truncate = self.sql_database.truncate_word
+                    rows = [tuple(truncate(value, length=self.sql_database._max_string_length) for value in row) for row in rows]
+                    if rows == [tuple(row) for row in response.metadata.get("result", [])]:
+                        cached = entry
+                except Exception as e:
+                    print(f"Cached SQL check failed: {e}")
+        if cached is None:
+            self.stats.uncacheable += 1
+        else:
+            self._store(template, cached)
+
+    def _hit_response(self, question: str, entry: SQLTemplate, values: List[str]):
+        col_keys, rows = self.run_sql(entry.sql, bind_params(entry.params, values))
+        metadata = {"sql_query": entry.sql, "result": rows, "col_keys": col_keys, "cache_hit": True}
+        if not self.synthesize:
+            return None, metadata, format_rows(col_keys, rows)
+        prompt = DEFAULT_RESPONSE_SYNTHESIS_PROMPT_V2.format(
+            query_str=question, sql_query=entry.sql, context_str=format_rows(col_keys, rows)
+        )
+        return prompt, metadata, None
+
+    def _miss_response(self, response):
+        response.metadata = {**(response.metadata or {}), "cache_hit": False}
+        if not self.synthesize:
+            response.response = format_rows(response.metadata.get("col_keys", []), response.metadata.get("result", []))
+        return response
+
+    def _query_and_learn(self, question: str, template: str, values: List[str]):
+        response = self.query_engine.query(question)
+        self._learn(template, values, response)
+        return self._miss_response(response)
+
+    def query(self, question: str):
+        template, values = mask_entities(str(question))
+        entry = self._lookup(template)
+        if entry is not None:
+            prompt, metadata, answer = self._hit_response(question, entry, values)
+            if prompt is not None:
+                answer = str((self.llm or Settings.llm).complete(prompt))
+            return Response(response=answer, metadata=metadata)
+        return self._query_and_learn(question, template, values)
+
+    async def aquery(self, question: str):
+        loop = asyncio.get_running_loop()
+        template, values = mask_entities(str(question))
+        entry = self._lookup(template)
+        if entry is not None:
+            prompt, metadata, answer = await loop.run_in_executor(
+                self.executor, self._hit_response, question, entry, values
+            )
+            if prompt is not None:
+                answer = str(await (self.llm or Settings.llm).acomplete(prompt))
+            return Response(response=answer, metadata=metadata)
+
+        # the NLSQL engine runs its SQL synchronously even from aquery, so the whole miss goes to the pool
+        return await loop.run_in_executor(self.executor, self._query_and_learn, question, template, values)
@@ -1,6 +1,7 @@
 import os
 import json
 import asyncio
+import weakref
 import nest_asyncio
 from dotenv import load_dotenv
 from llama_index.core.workflow import (
@@ -11,14 +12,10 @@ from llama_index.core.workflow import (
     StopEvent,
     Workflow,
 )
-from llama_index.llms.gemini import Gemini
-from llama_index.core.tools import FunctionTool
-from retriever import get_query_engine
-from customer_db import create_banking_customer_db
-from pending_tx_agent import get_pending_tx_details
 from llama_index.core.agent import ReActAgent
-from llama_index.llms.openai import OpenAI
-from wf_agents import interest_rate_rag_tool, customer_details_tool, pending_tx_details_tool
+from agent_pool import AgentPool
+from services import lazy_attributes, services
+from token_stream import StreamTimingEvent, TokenEvent, stream_completion
 
 # Apply nest_asyncio to allow nested event loops
 nest_asyncio.apply()
@@ -29,21 +26,59 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-llm = OpenAI(model="gpt-4o-mini",api_key=OPENAI_API_KEY)
+def create_llm():
+    # the OpenAI (or Gemini) stack is imported only when the engine's LLM is first needed
+    from llama_index.llms.openai import OpenAI
+    return OpenAI(model="gpt-4o-mini",api_key=OPENAI_API_KEY)
 
-# llm = Gemini(model="models/gemini-2.0-flash-001",api_key=GOOGLE_API_KEY)
+    # from llama_index.llms.gemini import Gemini
+    # return Gemini(model="models/gemini-2.0-flash-001",api_key=GOOGLE_API_KEY)
+
+services.register("sub_question_query_engine.llm", create_llm, per_process=True)
+
+__getattr__ = lazy_attributes(__name__, {"llm": "sub_question_query_engine.llm"})
+
+# sub-questions answered at once in parallel mode; the step allows up to
+# max_sub_question_workers and each engine narrows that to its num_workers
+sub_question_workers = 4
+max_sub_question_workers = 16
+
+# ReAct agents reused across sub-questions and runs
+react_agent_pool = AgentPool(lambda tools, llm: ReActAgent.from_tools(tools, llm=llm, verbose=True))
 
 class QueryEvent(Event):
     question: str
+    index: int = 0
 
 class AnswerEvent(Event):
     question: str
     answer: str
+    index: int = 0
 
 class SubQuestionQueryEngine(Workflow):
+    """
+    Breaks a query into sub-questions, answers each with a ReAct agent and combines
+    the answers. In parallel mode (the default) all sub-questions are dispatched at
+    once, at most num_workers at a time, and the answers are combined in question
+    order; parallel=False answers them one after another.
+    """
+
+    def __init__(self, *args, parallel: bool = True, num_workers: int = sub_question_workers, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parallel = parallel
+        self.num_workers = min(num_workers, max_sub_question_workers)
+        # semaphores belong to one event loop: keep one per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _worker_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.num_workers)
+        return semaphore
 
     @step(pass_context=True)
-    async def query(self, ctx: Context, ev: StartEvent) -> QueryEvent:
+    async def query(self, ctx: Context, ev: StartEvent) -> QueryEvent | None:
         """Generate sub-questions based on the original query."""
         # Store the original query in the context
         await ctx.set("original_query", ev.query)
@@ -61,7 +96,7 @@ class SubQuestionQueryEngine(Workflow):
         tools = await ctx.get("tools")
         
         # Generate sub-questions using the LLM
-        response = llm.complete(f"""
+        response = await llm.acomplete(f"""
         You are a helpful assistant that breaks down complex questions into simpler sub-questions.
         
         For the given user question, generate a list of sub-questions that would help answer the original question.
@@ -109,13 +144,20 @@ class SubQuestionQueryEngine(Workflow):
                 response_obj = {"sub_questions": [original_query]}
         
         # Store the sub-questions in the context
-        await ctx.set("sub_questions", response_obj["sub_questions"])
+        sub_questions = response_obj.get("sub_questions") or [original_query]
+        await ctx.set("sub_questions", sub_questions)
         await ctx.set("answers", [])
+
+        if self.parallel:
+            # Dispatch every sub-question at once; combine_answers waits for all of them
+            for index, question in enumerate(sub_questions):
+                ctx.send_event(QueryEvent(question=question, index=index))
+            return None
         
         # Return the first sub-question
-        return QueryEvent(question=response_obj["sub_questions"][0])
+        return QueryEvent(question=sub_questions[0], index=0)
 
-    @step(pass_context=True)
+    @step(pass_context=True, num_workers=max_sub_question_workers)
     async def sub_question(self, ctx: Context, ev: QueryEvent) -> AnswerEvent:
         """Answer a sub-question using the appropriate tool."""
         print(f"Sub-question is {ev.question}")
@@ -125,10 +167,11 @@ class SubQuestionQueryEngine(Workflow):
         llm = await ctx.get("llm")
         
         # Use ReActAgent to handle the tools
-        agent = ReActAgent.from_tools(tools, llm=llm, verbose=True)
-        response = agent.chat(ev.question)
+        async with self._worker_semaphore():
+            with react_agent_pool.lease(tools, llm) as agent:
+                response = await agent.achat(ev.question)
         
-        return AnswerEvent(question=ev.question, answer=str(response))
+        return AnswerEvent(question=ev.question, answer=str(response), index=ev.index)
 
     @step(pass_context=True)
     async def combine_answers(self, ctx: Context, ev: AnswerEvent) -> StopEvent | None:
@@ -136,9 +179,19 @@ class SubQuestionQueryEngine(Workflow):
         # Get the answers and sub-questions from the context
         answers = await ctx.get("answers") or []
         sub_questions = await ctx.get("sub_questions") or []
-        
-        # Add the new answer to the list
-        answers.append({"question": ev.question, "answer": ev.answer})
+
+        if self.parallel:
+            # Buffer answers until every sub-question is answered, then keep question order
+            events = ctx.collect_events(ev, [AnswerEvent] * len(sub_questions))
+            if events is None:
+                return None
+            answers = [
+                {"question": e.question, "answer": e.answer}
+                for e in sorted(events, key=lambda e: e.index)
+            ]
+        else:
+            # Add the new answer to the list
+            answers.append({"question": ev.question, "answer": ev.answer})
         
         # Update the answers in the context
         await ctx.set("answers", answers)
@@ -166,38 +219,50 @@ class SubQuestionQueryEngine(Workflow):
             
             print(f"Final prompt is {prompt}")
             
-            response = llm.complete(prompt)
+            # streamed as TokenEvents while it is written
+            response = await stream_completion(ctx, llm, prompt, "sub_questions.combine_answers")
             
             print("Final response is", response)
             
-            return StopEvent(result=str(response))
+            return StopEvent(result=response)
         
         # If we don't have answers for all sub-questions yet, continue
         # Get the next unanswered sub-question
         answered_questions = [a["question"] for a in answers]
-        for question in sub_questions:
+        for index, question in enumerate(sub_questions):
             if question not in answered_questions:
-                return QueryEvent(question=question)
+                return QueryEvent(question=question, index=index)
         
         # If all questions are answered but we didn't return a StopEvent earlier,
         # something went wrong, so return a default response
         return StopEvent(result="Failed to generate a complete answer.")
     
-query_engine_tools = []
+async def main():
+    # imported here: users of the engine (e.g. the benchmark) don't need the banking tools
+    from wf_agents import interest_rate_rag_tool, customer_details_tool, pending_tx_details_tool, pending_tx_summary_tool
 
-query_engine_tools.append(interest_rate_rag_tool)
-query_engine_tools.append(customer_details_tool)
-query_engine_tools.append(pending_tx_details_tool)
+    query_engine_tools = []
 
-engine = SubQuestionQueryEngine(timeout=300, verbose=True)
+    query_engine_tools.append(interest_rate_rag_tool)
+    query_engine_tools.append(customer_details_tool)
+    query_engine_tools.append(pending_tx_details_tool)
+    query_engine_tools.append(pending_tx_summary_tool)
 
-async def main():
-    result = await engine.run(
-        llm=llm,
+    engine = SubQuestionQueryEngine(timeout=300, verbose=True)
+
+    handler = engine.run(
+        llm=services.get("sub_question_query_engine.llm"),
         tools=query_engine_tools,
         query="List all the details of Bob Brown?")
+    async for event in handler.stream_events():
+        if isinstance(event, TokenEvent):
+            print(event.delta, end="", flush=True)
+        elif isinstance(event, StreamTimingEvent):
+            print(f"\nFirst token after {event.first_token_ms} ms, answer after {event.total_ms} ms")
+    result = await handler
     
     print(result)
+    print("Agent pool:", react_agent_pool.stats.summary())
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+import time
+from typing import Dict
+
+from llama_index.core.workflow import Context, Event
+
+class TokenEvent(Event):
+    """
+    A piece of a final answer, written to the workflow's stream as the LLM
+    generates it. `attempt` tells answers to the same request apart, e.g. the
+    advisor's rewrite after a review (which replaces the earlier answer). A
+    `draft` answer is still to be reviewed and may be rejected.
+    """
+    source: str
+    delta: str
+    attempt: int = 0
+    draft: bool = False
+
+class StreamTimingEvent(Event):
+    """Time to the first token and to the whole answer of one streamed completion."""
+    source: str
+    attempt: int
+    first_token_ms: float
+    total_ms: float
+    chunks: int
+
+class StreamStats:
+    def __init__(self):
+        self.streams = 0
+        self.chunks = 0
+        self.first_token_seconds = 0.0
+        self.total_seconds = 0.0
+
+    def summary(self) -> dict:
+        return {
+            "streams": self.streams,
+            "mean_chunks": round(self.chunks / self.streams, 1) if self.streams else 0.0,
+            "mean_first_token_ms": round(self.first_token_seconds / self.streams * 1000, 2) if self.streams else 0.0,
+            "mean_total_ms": round(self.total_seconds / self.streams * 1000, 2) if self.streams else 0.0,
+        }
+
+stream_stats: Dict[str, StreamStats] = {}
+
+async def stream_completion(ctx: Context, llm, prompt: str, source: str, attempt: int = 0, draft: bool = False) -> str:
+    """
+    Complete a prompt with astream_complete, writing each piece to the event
+    stream as a TokenEvent as soon as it arrives, then a StreamTimingEvent.
+    Returns the whole answer, like acomplete.
+    """
+    stats = stream_stats.setdefault(source, StreamStats())
+    start = time.perf_counter()
+    first_token = None
+    text = ""
+    chunks = 0
+    async for chunk in await llm.astream_complete(prompt):
+        # delta is the new piece; some LLMs only fill in the text so far
+        delta = chunk.delta if chunk.delta is not None else chunk.text[len(text):]
+        if not delta:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        text += delta
+        chunks += 1
+        ctx.write_event_to_stream(TokenEvent(source=source, delta=delta, attempt=attempt, draft=draft))
+    total = time.perf_counter() - start
+    first_token = total if first_token is None else first_token
+
+    stats.streams += 1
+    stats.chunks += chunks
+    stats.first_token_seconds += first_token
+    stats.total_seconds += total
+    ctx.write_event_to_stream(
+        StreamTimingEvent(
+            source=source,
+            attempt=attempt,
+            first_token_ms=round(first_token * 1000, 1),
+            total_ms=round(total * 1000, 1),
+            chunks=chunks,
+        )
+    )
+    return text
@@ -0,0 +1,194 @@
+"""
+Warm up a worker before it takes traffic, and signal when it is ready.
+
+warm_up() loads the vector index, opens the customer DB, loads the pending
+transactions and primes the embedding, answer and SQL template caches with
+common questions. Only then is the worker marked ready: `readiness` is set and
+`ready_file` is written, for a readiness probe such as
+
+    python warmup.py --check
+
+run_forked() warms up once and then forks worker processes, which share the
+loaded index and data with the parent copy-on-write; each worker builds its
+own LLM clients and DB connections. As a script, the workers report how much
+of their memory is shared, e.g.
+
+    python warmup.py --workers 4
+"""
+import argparse
+import gc
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+import customer_db
+import pending_tx_agent
+import retriever
+from services import services
+
+# written once warm, removed on exit; its presence is the readiness signal
+ready_file = "./.ready"
+
+# common questions, as in app.py's main
+warmup_interest_rate_questions = [
+    "Whats the Cash ISA Saver's annual interest rate for an account opened after 18/02/25?",
+]
+warmup_customer_questions = [
+    "List all the details of Bob Brown?",
+]
+warmup_pending_tx_questions = [
+    "What is the total amount of pending transactions for Bob Brown and round off to 2 decimal places?",
+]
+
+readiness = threading.Event()
+
+def is_ready() -> bool:
+    return readiness.is_set()
+
+def mark_ready(report: dict, path: str = ready_file):
+    readiness.set()
+    with open(path + ".tmp", "w") as f:
+        json.dump({"pid": os.getpid(), **report}, f)
+    os.replace(path + ".tmp", path)
+
+def clear_ready(path: str = ready_file):
+    readiness.clear()
+    if os.path.exists(path):
+        os.remove(path)
+
+def check_ready(path: str = ready_file) -> bool:
+    """True if a live process wrote the ready file (for probes run in another process)."""
+    try:
+        with open(path) as f:
+            pid = json.load(f)["pid"]
+        os.kill(pid, 0)
+    except (OSError, ValueError, KeyError):
+        return False
+    return True
+
+def _timed(report: dict, name: str, fn: Callable):
+    start = time.perf_counter()
+    result = fn()
+    report["steps_ms"][name] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+def _prime(report: dict, name: str, ask: Callable[[str], object], questions: List[str]):
+    """Ask the questions to fill the caches; a failed question doesn't fail the warm-up."""
+    def run():
+        for question in questions:
+            try:
+                ask(question)
+            except Exception as e:
+                report["errors"].append(f"{name}: {question!r}: {e}")
+                print(f"warm-up question failed ({name}): {e}")
+    _timed(report, name, run)
+
+def warm_up(
+    interest_rate_questions: Optional[List[str]] = None,
+    customer_questions: Optional[List[str]] = None,
+    pending_tx_questions: Optional[List[str]] = None,
+    path: Optional[str] = ready_file,
+) -> dict:
+    """
+    Build everything the first request would otherwise wait for, prime the caches,
+    then mark the worker ready. Failing to load a data source raises and leaves
+    the worker not ready. Pass path=None to skip the ready file (e.g. before forking).
+    """
+    report = {"steps_ms": {}, "errors": []}
+    start = time.perf_counter()
+
+    _timed(report, "vector_index", retriever.index_registry.get_index)
+    _timed(report, "query_engine", retriever.get_query_engine)
+    _timed(report, "customer_db", lambda: services.get("customer_db.query_engine"))
+    _timed(report, "pending_tx", pending_tx_agent.get_pending_tx_store)
+
+    _prime(report, "interest_rate_questions", retriever.query_interest_rates,
+           warmup_interest_rate_questions if interest_rate_questions is None else interest_rate_questions)
+    _prime(report, "customer_questions", lambda q: services.get("customer_db.query_engine").query(q),
+           warmup_customer_questions if customer_questions is None else customer_questions)
+    _prime(report, "pending_tx_questions", pending_tx_agent.get_pending_tx_details,
+           warmup_pending_tx_questions if pending_tx_questions is None else pending_tx_questions)
+
+    report["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    report["services"] = services.summary()["built"]
+    if path is not None:
+        mark_ready(report, path)
+    return report
+
+def memory_summary() -> dict:
+    """Resident, proportional and shared memory of this process in MB (Linux only)."""
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_clean_mb", "Shared_Dirty": "shared_dirty_mb"}
+    summary = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    summary[fields[key]] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return summary
+
+def run_forked(worker: Callable[[int], None], workers: int, path: str = ready_file, **warm_up_kwargs) -> dict:
+    """
+    Warm up in this process, fork `workers` children that each run worker(index),
+    and wait for them. The ready file is written once all children are forked.
+    """
+    report = warm_up(path=None, **warm_up_kwargs)
+    # move everything built so far out of the collector's generations: the children's
+    # collections no longer walk (and so write to) these shared pages
+    gc.collect()
+    gc.freeze()
+    children = []
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                worker(index)
+            except BaseException as e:
+                print(f"worker {index} failed: {e}")
+                status = 1
+            finally:
+                os._exit(status)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    mark_ready({**report, "workers": children}, path)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    finally:
+        clear_ready(path)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="exit 0 if a warmed-up process is ready, 1 otherwise")
+    parser.add_argument("--workers", type=int, default=0, help="fork this many workers after warming up")
+    parser.add_argument("--ready-file", default=ready_file)
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_ready(args.ready_file) else 1)
+
+    if args.workers:
+        def report_memory(index: int):
+            print(json.dumps({"worker": index, "pid": os.getpid(), **memory_summary()}))
+
+        report = run_forked(report_memory, args.workers, args.ready_file)
+        print(json.dumps({"parent": os.getpid(), **memory_summary(), **report}, indent=2))
+    else:
+        report = warm_up(path=args.ready_file)
+        print(json.dumps({**report, **memory_summary()}, indent=2))
@@ -1,13 +1,9 @@
 import os
-from retriever import get_query_engine
-from llama_index.core.agent.workflow import AgentWorkflow
-from llama_index.llms.gemini import Gemini
+from retriever import aquery_interest_rates
 from datetime import datetime
-from llama_index.core.workflow import Context
-from customer_db import create_banking_customer_db
-import pandas as pd
 from dotenv import load_dotenv
-from pending_tx_agent import create_pending_tx_query_engine
+from pending_tx_agent import aget_pending_tx_details, pending_tx_summary_tool
+from async_tools import async_tool
 from llama_index.core.tools import FunctionTool
 from llama_index.core.workflow import (
     step,
@@ -18,6 +14,17 @@ from llama_index.core.workflow import (
     Workflow,
 )
 from llama_index.core.agent import FunctionCallingAgent
+from agent_pool import AgentPool
+from rate_limit import AdmissionGate, RateLimitedLLM, TokenBucket, count_llm_calls
+from services import lazy_attributes, services
+from lazy_llm import LazyLLM
+from token_stream import StreamTimingEvent, TokenEvent, stream_completion
+import customer_db  # registers the customer_db.* services used by the tools
+import asyncio
+import re
+import weakref
+from dataclasses import dataclass
+from typing import List, Optional
 
 today = datetime.now().strftime("%d/%m/%Y")
 
@@ -25,27 +32,63 @@ load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-query_engine = get_query_engine()
+# Gemini requests per second (sustained) and burst shared by every LLM call of the workflow
+llm_requests_per_second = 2.0
+llm_burst = 5
+# LLM calls queued for the rate limiter (16 s of calls at 2/s) before more fail with Overloaded
+max_llm_waiters = 32
 
-customer_db_query_engine = create_banking_customer_db()
+# questions answered at once per run; answer_question allows up to max_question_workers
+question_workers = 4
+max_question_workers = 16
 
-pending_tx_query_engine = create_pending_tx_query_engine()
+# advisor runs executing at once, and queued behind them before new ones are turned away
+max_in_flight_requests = 8
+max_waiting_requests = 32
 
-llm = Gemini(model="models/gemini-1.5-pro",api_key=GOOGLE_API_KEY)
+# review rounds after the first answer, new questions a review may ask, and the LLM
+# calls/tokens (estimated at 4 characters a token) a request may spend before the
+# current answer is returned as final. Calls are counted at the LLM, so an agent
+# answering a question counts each of its calls: at least min_llm_calls_per_question
+# (one to call a tool, one to answer from its output).
+max_review_rounds = 2
+max_review_questions = 4
+max_llm_calls_per_request = 20
+max_llm_tokens_per_request = 50_000
+min_llm_calls_per_question = 2
 
+llm_rate_limiter = TokenBucket(llm_requests_per_second, llm_burst, max_llm_waiters)
+
+request_gate = AdmissionGate(max_in_flight_requests, max_waiting_requests)
+
+def create_llm():
+    from llama_index.llms.gemini import Gemini
+    return Gemini(model="models/gemini-1.5-pro",api_key=GOOGLE_API_KEY)
+
+# importing this module builds nothing: the Gemini client and the data sources
+# behind the tools are created on first use
+services.register("wf_agents.llm", create_llm, per_process=True)
+
+# rate limited and counted whichever LLM serves wf_agents.llm (e.g. fake_llm's)
+llm = RateLimitedLLM(LazyLLM("wf_agents.llm"), llm_rate_limiter)
+
+__getattr__ = lazy_attributes(__name__, {"customer_db_query_engine": "customer_db.query_engine"})
+
+@async_tool(timeout=60)
 async def search_interest_rates(question: str) -> str:
     """Ask a question to the bank account interest rate documents stored in the vector index."""
-    response = query_engine.query(question)
-    return str(response)
+    return await aquery_interest_rates(question)
 
+@async_tool(max_concurrency=8, timeout=60)
 async def search_customer_details(question: str) -> str:
     """Ask a question to the bank customer database which contains customer and account information in a SQL database."""
-    response = customer_db_query_engine.query(question)
+    response = await services.get("customer_db.query_engine").aquery(question)
     return str(response)
 
+@async_tool(max_concurrency=8, timeout=60)
 async def search_pending_tx_details(question: str) -> str:
     """Get the total amount of pending transactions for a customer from a Pandas dataframe."""
-    response = pending_tx_query_engine.query(question)
+    response = await aget_pending_tx_details(question)
     return str(response)
 
 # tools 
@@ -67,6 +110,16 @@ pending_tx_details_tool = FunctionTool.from_defaults(
     description="search the total amount of pending transactions for a customer from a Pandas dataframe",
 )
 
+# function calling agents reused across questions and runs (llm=None uses the
+# customer DB's Gemini model)
+function_agent_pool = AgentPool(
+    lambda tools, llm: FunctionCallingAgent.from_tools(
+        tools,
+        llm=RateLimitedLLM(llm or LazyLLM("customer_db.llm"), llm_rate_limiter),
+        verbose=True,
+    )
+)
+
 # events def
 class OutlineEvent(Event):
     outline: str
@@ -79,13 +132,108 @@ class AnswerEvent(Event):
     answer: str
 
 class ReviewEvent(Event):
-    final_answer: str
+    answer: str
+    # why the answer is final without a review ("rounds" or "budget"), None to review it
+    final_reason: Optional[str] = None
 
 class ProgressEvent(Event):
     progress: str
 
+class UsageEvent(Event):
+    """LLM calls per stage (each call of an agent run counted) and estimated tokens of one request, written to the stream at the end."""
+    calls: dict
+    llm_calls: int
+    estimated_tokens: int
+    review_rounds: int
+    budget_exhausted: bool
+
+@dataclass
+class ReviewVerdict:
+    accepted: bool
+    questions: List[str]
+
+# the verdict token the review prompt asks for, as a whole word
+review_verdict_pattern = re.compile(r"\bOKAY\b")
+
+def parse_review(text: str, max_questions: int = max_review_questions) -> ReviewVerdict:
+    """
+    Parse the reviewer's reply: 'OKAY' (in any case, quoted or with trailing
+    punctuation) on its own line, or the word OKAY in capitals on the last line
+    ("The answer is fine. OKAY"), accepts the answer; otherwise each non-empty
+    line is a follow-up question, without list markers.
+    """
+    lines = [line.strip().strip("`'\"*").strip() for line in str(text).strip().splitlines()]
+    lines = [line for line in lines if line]
+    if (
+        not lines
+        or any(line.rstrip(".!").upper() == "OKAY" for line in lines)
+        or review_verdict_pattern.search(lines[-1])
+    ):
+        return ReviewVerdict(accepted=True, questions=[])
+    questions = [re.sub(r"^(?:[-*•]|\d+[.)])\s*", "", line) for line in lines]
+    questions = [question for question in questions if question]
+    return ReviewVerdict(accepted=not questions, questions=questions[:max_questions])
+
+def estimate_tokens(*texts) -> int:
+    return sum(len(str(text)) for text in texts) // 4
+
 class CustomerInvestmentAdvisorAgent(Workflow):
 
+    def __init__(self, *args, question_workers: int = question_workers, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.question_workers = min(question_workers, max_question_workers)
+        # semaphores belong to one event loop: keep one per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _question_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.question_workers)
+        return semaphore
+
+    async def _record_usage(self, ctx: Context, stage: str, calls: int, *texts):
+        """Add the LLM calls of a stage (as counted by count_llm_calls) and its estimated tokens."""
+        usage = await ctx.get("usage")
+        usage["calls"][stage] += calls
+        usage["tokens"] += estimate_tokens(*texts)
+        await ctx.set("usage", usage)
+
+    async def _budget_left(self, ctx: Context):
+        """LLM calls and estimated tokens the request may still spend."""
+        usage = await ctx.get("usage")
+        calls_left = await ctx.get("max_llm_calls") - sum(usage["calls"].values())
+        tokens_left = await ctx.get("max_llm_tokens") - usage["tokens"]
+        return calls_left, tokens_left
+
+    @staticmethod
+    def _affordable_questions(calls_left: int) -> int:
+        # room is left for the final answer and its review
+        return (calls_left - 2) // min_llm_calls_per_question
+
+    async def _review_blocker(self, ctx: Context) -> Optional[str]:
+        """Why the next answer will be final without a review, or None if it will be reviewed."""
+        if await ctx.get("review_rounds", default=0) >= max_review_rounds:
+            return "rounds"
+        # a review round costs the review, at least one answered question and a new final answer
+        calls_left, tokens_left = await self._budget_left(ctx)
+        if self._affordable_questions(calls_left - 1) < 1 or tokens_left <= 0:
+            return "budget"
+        return None
+
+    async def _finish(self, ctx: Context, answer: str, budget_exhausted: bool = False) -> StopEvent:
+        usage = await ctx.get("usage")
+        ctx.write_event_to_stream(
+            UsageEvent(
+                calls=usage["calls"],
+                llm_calls=sum(usage["calls"].values()),
+                estimated_tokens=usage["tokens"],
+                review_rounds=await ctx.get("review_rounds", default=0),
+                budget_exhausted=budget_exhausted,
+            )
+        )
+        return StopEvent(result=answer)
+
     @step()
     async def formulate_plan(
         self, ctx: Context, ev: StartEvent
@@ -93,10 +241,18 @@ class CustomerInvestmentAdvisorAgent(Workflow):
         query = ev.query
         await ctx.set("original_query", query)
         await ctx.set("tools", ev.tools)
+        await ctx.set("usage", {
+            "calls": {"plan": 0, "questions": 0, "answer": 0, "final": 0, "review": 0},
+            "tokens": 0,
+        })
+        await ctx.set("max_llm_calls", ev.get("max_llm_calls", max_llm_calls_per_request))
+        await ctx.set("max_llm_tokens", ev.get("max_llm_tokens", max_llm_tokens_per_request))
 
         prompt = f"""You are an expert in formulating plans to answer queries by customers on their bank account interest rates, customer details and pending transactions. : {query}     """
     
-        response = await llm.acomplete(prompt)
+        with count_llm_calls() as count:
+            response = await llm.acomplete(prompt)
+        await self._record_usage(ctx, "plan", count.calls, prompt, response)
 
         ctx.write_event_to_stream(
             ProgressEvent(progress="Outline:\n" + str(response))
@@ -124,10 +280,23 @@ class CustomerInvestmentAdvisorAgent(Workflow):
         - Whats the total amount of pending transactions? The information is stored in the Pandas dataframe : {outline}.
         Generate 1 question each for the above scenarios.
         """
-        response = await llm.acomplete(prompt)
+        with count_llm_calls() as count:
+            response = await llm.acomplete(prompt)
+        await self._record_usage(ctx, "questions", count.calls, prompt, response)
 
         questions = str(response).split("\n")
-        questions = [x for x in questions if x]
+        # blank lines would never be answered and stall write_final_answer
+        questions = [x for x in questions if x.strip()]
+
+        # every question is an agent run: ask only what the budget pays for (at least
+        # one, as the final answer waits for an answer)
+        calls_left, tokens_left = await self._budget_left(ctx)
+        affordable = max(1, self._affordable_questions(calls_left)) if tokens_left > 0 else 1
+        if len(questions) > affordable:
+            ctx.write_event_to_stream(
+                ProgressEvent(progress=f"LLM budget allows {affordable} of {len(questions)} questions")
+            )
+            questions = questions[:affordable]
 
         ctx.write_event_to_stream(
             ProgressEvent(
@@ -145,7 +314,7 @@ class CustomerInvestmentAdvisorAgent(Workflow):
             ctx.send_event(QuestionEvent(question=question))
     
 
-    @step()
+    @step(num_workers=max_question_workers)
     async def answer_question(
         self, ctx: Context, ev: QuestionEvent
     ) -> AnswerEvent:
@@ -160,11 +329,10 @@ class CustomerInvestmentAdvisorAgent(Workflow):
                 ProgressEvent(progress=f"Skipping empty question.")
             )  # Log skipping empty question
             return None
-        agent = FunctionCallingAgent.from_tools(
-            await ctx.get("tools"),
-            verbose=True,
-        )
-        response = await agent.aquery(question)
+        async with self._question_semaphore():
+            with function_agent_pool.lease(await ctx.get("tools")) as agent, count_llm_calls() as count:
+                response = await agent.aquery(question)
+        await self._record_usage(ctx, "answer", count.calls, question, response)
 
         ctx.write_event_to_stream(
             ProgressEvent(
@@ -203,47 +371,62 @@ class CustomerInvestmentAdvisorAgent(Workflow):
             ProgressEvent(progress="Writing answer with prompt:\n" + prompt)
         )
 
-        answer = await llm.acomplete(prompt)
+        # streamed to the customer as it is written, as a draft while a review can still
+        # reject it; a rewrite after a review is the next attempt
+        final_reason = await self._review_blocker(ctx)
+        with count_llm_calls() as count:
+            answer = await stream_completion(
+                ctx, llm, prompt, "advisor.final_answer",
+                attempt=await ctx.get("review_rounds", default=0), draft=final_reason is None,
+            )
+        await self._record_usage(ctx, "final", count.calls, prompt, answer)
 
-        return ReviewEvent(answer=str(answer))
+        return ReviewEvent(answer=answer, final_reason=final_reason)
     
     @step
     async def review_answer(
         self, ctx: Context, ev: ReviewEvent
     ) -> StopEvent | QuestionEvent:
-        # we re-review a maximum of 3 times
-        try:
-            num_reviews = await ctx.get("num_reviews")
-        except:
-            num_reviews = 1
-        num_reviews += 1
-        await ctx.set("num_reviews", num_reviews)
-
         answer = ev.answer
+        # decided before the answer was written, which streamed it as final
+        if ev.final_reason == "rounds":
+            ctx.write_event_to_stream(ProgressEvent(progress="Review rounds used up, returning the answer"))
+            return await self._finish(ctx, answer)
+        if ev.final_reason == "budget":
+            ctx.write_event_to_stream(ProgressEvent(progress="LLM budget used up, returning the answer"))
+            return await self._finish(ctx, answer, budget_exhausted=True)
+        await ctx.set("review_rounds", await ctx.get("review_rounds", default=0) + 1)
+        calls_left, _ = await self._budget_left(ctx)
 
         prompt = f"""You are an expert reviewer of answers to customer queries on account interest rates, customer details and pending transactions. You are given an original query,
         and an answer that was written to satisfy that query. Review the answer and determine
         if it adequately answers the query and contains enough detail. If it doesn't, come up with
         a set of questions that will get you the facts necessary to expand the answer. Another
         agent will answer those questions. Your response should just be a list of questions, one
-        per line, without any preamble or explanation. For speed, generate a maximum of 4 questions.
+        per line, without any preamble or explanation. For speed, generate a maximum of {max_review_questions} questions.
         The original query is: '{await ctx.get('original_query')}'.
         The answer is: <answer>{answer}</answer>.
         If the answer is fine, return just the string 'OKAY'."""
 
         # response = await Settings.llm.acomplete(prompt)
-        response = await llm.acomplete(prompt)
+        with count_llm_calls() as count:
+            response = await llm.acomplete(prompt)
+        await self._record_usage(ctx, "review", count.calls, prompt, response)
 
-        if response == "OKAY" or await ctx.get("num_reviews") >= 3:
+        # leave room for the final answer after the follow-up questions
+        verdict = parse_review(
+            str(response), max_questions=min(max_review_questions, self._affordable_questions(calls_left))
+        )
+        if verdict.accepted:
             ctx.write_event_to_stream(
                 ProgressEvent(progress="Answer is fine")
             )
-            return StopEvent(result=answer)
-        else:
-            questions = str(response).split("\n")
-            await ctx.set("num_questions", len(questions))
-            ctx.write_event_to_stream(
-                ProgressEvent(progress="Formulated some more questions")
-            )
-            for question in questions:
-                ctx.send_event(QuestionEvent(question=question))
+            return await self._finish(ctx, answer)
+
+        questions = verdict.questions
+        await ctx.set("num_questions", len(questions))
+        ctx.write_event_to_stream(
+            ProgressEvent(progress="Formulated some more questions")
+        )
+        for question in questions:
+            ctx.send_event(QuestionEvent(question=question))
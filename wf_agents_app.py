@@ -1,14 +1,67 @@
-from wf_agents import CustomerInvestmentAdvisorAgent, interest_rate_rag_tool, customer_details_tool, pending_tx_details_tool
-import asyncio  
-
-async def get_answer(query):
-    agent = CustomerInvestmentAdvisorAgent(timeout=600, verbose=True)
-    handler = agent.run(
-        query=query,
-        tools=[interest_rate_rag_tool, customer_details_tool, pending_tx_details_tool],
-    )
-    final_result = await handler
+from wf_agents import CustomerInvestmentAdvisorAgent, interest_rate_rag_tool, customer_details_tool, pending_tx_details_tool, pending_tx_summary_tool
+from wf_agents import llm_rate_limiter, request_gate, question_workers, UsageEvent, TokenEvent, StreamTimingEvent
+from rate_limit import overloaded_cause
+import asyncio
+
+advisor_tools = [interest_rate_rag_tool, customer_details_tool, pending_tx_details_tool, pending_tx_summary_tool]
+
+def start_advisor(query, question_workers=question_workers, verbose=True, timeout=600):
+    """Start an advisor workflow run; the handler streams its ProgressEvents and UsageEvent and awaits to the answer."""
+    agent = CustomerInvestmentAdvisorAgent(timeout=timeout, verbose=verbose, question_workers=question_workers)
+    return agent.run(query=query, tools=advisor_tools)
+
+async def get_answer(
+    query,
+    question_workers=question_workers,
+    llm_requests_per_second=None,
+    llm_burst=None,
+    max_in_flight=None,
+    max_waiting=None,
+):
+    """
+    Answer a query with the advisor workflow.
+
+    question_workers bounds the questions answered at once in this run. The
+    LLM rate limit and the request queue are shared by all runs: passing
+    llm_requests_per_second, llm_burst, max_in_flight or max_waiting changes them
+    for everyone. When max_in_flight runs are busy and max_waiting are queued,
+    the query is turned away with a "busy" answer instead of queueing, as it is
+when its LLM calls would queue behind too many others.
+
+    The final answer is printed as it is written, with the time to its first
+    token (headed as a draft while a review may still reject it), and the LLM
+    calls the run made per stage once it finishes.
+    """
+    llm_rate_limiter.configure(rate=llm_requests_per_second, capacity=llm_burst)
+    request_gate.configure(max_in_flight=max_in_flight, max_waiting=max_waiting)
+    try:
+        async with request_gate.admit():
+            handler = start_advisor(query, question_workers)
+            attempt = None
+            async for event in handler.stream_events():
+                if isinstance(event, TokenEvent):
+                    if event.attempt != attempt:
+                        attempt = event.attempt
+                        if event.draft:
+                            print("[draft, under review]")
+                    print(event.delta, end="", flush=True)
+                elif isinstance(event, StreamTimingEvent):
+                    print(f"\n(answer {event.attempt + 1}: first token after {event.first_token_ms} ms, done after {event.total_ms} ms)")
+                elif isinstance(event, UsageEvent):
+                    print(
+                        f"LLM calls: {event.llm_calls} {event.calls}, ~{event.estimated_tokens} tokens, "
+                        f"{event.review_rounds} review rounds"
+                        + (" (budget exhausted)" if event.budget_exhausted else "")
+                    )
+            final_result = await handler
+    except Exception as e:
+        # the request queue was full, or an LLM call of the run found the rate limiter's queue full
+        if overloaded_cause(e) is None:
+            raise
+        print(f"Request turned away: {overloaded_cause(e)}")
+        final_result = "We are handling a lot of requests right now, please try again in a moment."
     print(final_result)
+    return final_result
 
 
 if __name__ == "__main__":